@@ -1,5 +1,27 @@
+from array import array
+from collections import deque
 from enum import StrEnum
+import gzip
+import io
+import lzma
+import mmap
+import struct
+import sys
+from typing import (
+    IO,
+    BinaryIO,
+    Callable,
+    Dict,
+    Iterable,
+    List,
+    Literal,
+    TextIO,
+    Tuple,
+    Union,
+    overload,
+)
 
+from grape.automaton.compact_automaton import ID_TYPECODE, CompactDFTA
 from grape.automaton.tree_automaton import DFTA
 
 
@@ -7,6 +29,7 @@ class AutomatonFormat(StrEnum):
     EBNF = ".ebnf"
     GRAPE = ".grape"
     LARK = ".lark"
+    GRAPEB = ".grapeb"
 
     @staticmethod
     def from_str(content: str) -> "AutomatonFormat":
@@ -16,85 +39,251 @@ class AutomatonFormat(StrEnum):
         raise ValueError(f"invalid automaton format: '{content}")
 
 
+# Binary format, all integers are little endian 32 bits:
+#   - magic
+#   - number of states, letters, finals and arities
+#   - state names then letter names: byte length of each name followed by the UTF-8 names, padded to 4 bytes
+#   - final state ids
+#   - for each arity: arity, number of rules, then letter ids, destination ids and flat argument ids of all rules
+GRAPEB_MAGIC = b"GRAPEB01"
+
+
+# compression suffix -> function opening such a file
+COMPRESSIONS: Dict[str, Callable[..., IO]] = {".gz": gzip.open, ".xz": lzma.open}
+
+
+def format_of_file(file: str) -> AutomatonFormat:
+    """
+    Format given by the extension of the file, ignoring any compression suffix.
+    """
+    for suffix in COMPRESSIONS:
+        if file.endswith(suffix):
+            file = file[: -len(suffix)]
+    return AutomatonFormat.from_str(file[file.rfind(".") :])
+
+
+@overload
+def open_automaton_file(file: str, mode: Literal["r", "w"]) -> TextIO:
+    pass
+
+
+@overload
+def open_automaton_file(file: str, mode: Literal["rb", "wb"]) -> BinaryIO:
+    pass
+
+
+def open_automaton_file(file: str, mode: str) -> IO:
+    """
+    Opens the file, transparently (de)compressing it if needed.
+    mode: one of 'r', 'w', 'rb', 'wb'
+    """
+    for suffix, opener in COMPRESSIONS.items():
+        if file.endswith(suffix):
+            return opener(file, mode if "b" in mode else mode + "t")
+    return open(file, mode)
+
+
 def dump_automaton_to_file(dfta: DFTA, file: str) -> None:
-    extension = file[file.rfind(".") :]
-    with open(file, "w") as fd:
-        fd.write(dump_automaton_to_str(dfta, AutomatonFormat.from_str(extension)))
+    format = format_of_file(file)
+    if format == AutomatonFormat.GRAPEB:
+        with open_automaton_file(file, "wb") as fd:
+            dump_automaton_to_binary(dfta, fd)
+        return
+    with open_automaton_file(file, "w") as fd:
+        write_automaton(dfta, fd, format)
+
+
+def __ints_to_bytes__(values) -> bytes:
+    out = array(ID_TYPECODE, values)
+    if sys.byteorder != "little":
+        out.byteswap()
+    return out.tobytes()
+
+
+def __names_to_bytes__(names: List[str]) -> bytes:
+    encoded = [name.encode() for name in names]
+    data = __ints_to_bytes__([len(e) for e in encoded]) + b"".join(encoded)
+    return data + b"\0" * (-len(data) % 4)
+
+
+def dump_automaton_to_binary(dfta: DFTA, fd: BinaryIO) -> None:
+    compact = CompactDFTA.from_dfta(dfta)
+    fd.write(GRAPEB_MAGIC)
+    fd.write(
+        struct.pack(
+            "<4I",
+            len(compact.state_names),
+            len(compact.letter_names),
+            len(compact.finals),
+            len(compact.tables),
+        )
+    )
+    fd.write(__names_to_bytes__(list(map(str, compact.state_names))))
+    fd.write(__names_to_bytes__(list(map(str, compact.letter_names))))
+    fd.write(__ints_to_bytes__(compact.finals))
+    for arity in sorted(compact.tables):
+        letters, flat_args, dsts = compact.tables[arity]
+        fd.write(struct.pack("<2I", arity, len(dsts)))
+        fd.write(__ints_to_bytes__(letters))
+        fd.write(__ints_to_bytes__(dsts))
+        fd.write(__ints_to_bytes__(flat_args))
 
 
 def dump_automaton_to_str(dfta: DFTA, format: AutomatonFormat) -> str:
+    if format == AutomatonFormat.GRAPEB:
+        raise ValueError("binary format cannot be dumped to str")
+    fd = io.StringIO()
+    write_automaton(dfta, fd, format)
+    return fd.getvalue()
+
+
+def __write_lines__(fd: TextIO, lines: Iterable[str]) -> None:
+    for i, line in enumerate(lines):
+        if i > 0:
+            fd.write("\n")
+        fd.write(line)
+
+
+def write_automaton(dfta: DFTA, fd: TextIO, format: AutomatonFormat) -> None:
+    """
+    Writes the automaton line by line to the given text file object.
+    """
     if format == AutomatonFormat.GRAPE:
-        s = "finals:" + ",".join(sorted(map(str, dfta.finals))) + "\n"
-        s += "letters:" + ",".join(sorted(map(str, dfta.alphabet))) + "\n"
-        s += "states:" + ",".join(sorted(map(str, dfta.states))) + "\n"
-        lines = []
-        for (P, args), dst in dfta.rules.items():
+        fd.write("finals:" + ",".join(sorted(map(str, dfta.finals))) + "\n")
+        fd.write("letters:" + ",".join(sorted(map(str, dfta.alphabet))) + "\n")
+        fd.write("states:" + ",".join(sorted(map(str, dfta.states))) + "\n")
+
+        def rule_line(rule: Tuple[Tuple, object]) -> str:
+            (P, args), dst = rule
             add = ""
             if len(args) > 0:
                 add = "," + ",".join(map(str, args))
-            lines.append(f"{dst},{P}{add}")
+            return f"{dst},{P}{add}"
 
-        return s + "\n".join(sorted(lines))
+        __write_lines__(fd, sorted(map(rule_line, dfta.rules.items())))
     elif format == AutomatonFormat.EBNF:
-        elements = []
         dfta = dfta.map_states(lambda x: str(x).replace("=", "_").replace("-", "_"))
-        dfta.refresh_reversed_rules()
-        for dst, derivations in dfta.reversed_rules.items():
-            s = f"{dst} = "
+
+        def ebnf_line(dst, derivations) -> str:
             s_elements = []
             for P, args in derivations:
                 end = ", ".join(map(str, args))
                 if len(args) > 0:
                     end = " , " + end
                 s_elements.append(f'"{P}"{end}')
-            elements.append(s + " | ".join(s_elements) + ";")
-        return "\n".join(elements)
+            return f"{dst} = " + " | ".join(s_elements) + ";"
+
+        __write_lines__(
+            fd, (ebnf_line(dst, d) for dst, d in dfta.reversed_rules.items())
+        )
     elif format == AutomatonFormat.LARK:
-        elements = []
         dfta = dfta.map_states(lambda x: str(x).replace("=", "_").replace("-", "_"))
-        dfta.refresh_reversed_rules()
-        for dst, derivations in dfta.reversed_rules.items():
-            s = f"{dst} : "
+
+        def lark_line(dst, derivations) -> str:
             s_elements = []
             for P, args in derivations:
                 end = " ".join(map(str, args))
                 if len(args) > 0:
                     end = " " + end
                 s_elements.append(f'"{P}"{end}')
-            elements.append(s + " | ".join(s_elements))
-        return "\n".join(elements)
+            return f"{dst} : " + " | ".join(s_elements)
+
+        __write_lines__(
+            fd, (lark_line(dst, d) for dst, d in dfta.reversed_rules.items())
+        )
 
     else:
         raise ValueError(f"unsupported format:{format}")
 
 
 def load_automaton_from_file(file: str) -> DFTA[str, str]:
-    extension = file[file.rfind(".") :]
-    with open(file) as fd:
-        content = fd.read()
-        return load_automaton_from_str(content, AutomatonFormat.from_str(extension))
+    format = format_of_file(file)
+    if format == AutomatonFormat.GRAPEB:
+        with open_automaton_file(file, "rb") as fd:
+            if isinstance(fd, io.BufferedReader):
+                with mmap.mmap(fd.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+                    return load_automaton_from_binary(buffer)
+            return load_automaton_from_binary(fd.read())
+    with open_automaton_file(file, "r") as fd:
+        return read_automaton(fd, format)
+
+
+def load_automaton_from_binary(buffer: Union[bytes, mmap.mmap]) -> DFTA[str, str]:
+    """
+    Integer tables are copied in bulk from the buffer, no parsing is needed.
+    """
+    return load_compact_automaton_from_binary(buffer).to_dfta()
+
+
+def load_compact_automaton_from_binary(
+    buffer: Union[bytes, mmap.mmap],
+) -> CompactDFTA[str, str]:
+    with memoryview(buffer) as view:
+        if bytes(view[: len(GRAPEB_MAGIC)]) != GRAPEB_MAGIC:
+            raise ValueError("invalid automaton format: not a .grapeb file")
+        offset = len(GRAPEB_MAGIC)
+
+        def ints(n: int) -> array:
+            nonlocal offset
+            out = array(ID_TYPECODE)
+            out.frombytes(view[offset : offset + 4 * n])
+            if sys.byteorder != "little":
+                out.byteswap()
+            offset += 4 * n
+            return out
+
+        def names(n: int) -> List[str]:
+            nonlocal offset
+            lengths = ints(n)
+            out = []
+            for length in lengths:
+                out.append(str(view[offset : offset + length], "utf-8"))
+                offset += length
+            offset += -offset % 4
+            return out
+
+        nstates, nletters, nfinals, narities = struct.unpack_from("<4I", view, offset)
+        offset += 16
+        states = names(nstates)
+        letters = names(nletters)
+        finals = ints(nfinals)
+        tables: Dict[int, Tuple[array, array, array]] = {}
+        for _ in range(narities):
+            arity, nrules = struct.unpack_from("<2I", view, offset)
+            offset += 8
+            rule_letters = ints(nrules)
+            dsts = ints(nrules)
+            tables[arity] = (rule_letters, ints(nrules * arity), dsts)
+    return CompactDFTA(states, letters, finals, tables)
 
 
 def load_automaton_from_str(data: str, format: AutomatonFormat) -> DFTA[str, str]:
+    return read_automaton(io.StringIO(data), format)
+
+
+def read_automaton(fd: TextIO, format: AutomatonFormat) -> DFTA[str, str]:
+    """
+    Reads the automaton line by line from the given text file object.
+    """
     if format == AutomatonFormat.GRAPE:
-        lines = data.splitlines()
         finals = set(
-            map(lambda x: x.strip(), lines.pop(0)[len("finals:") :].split(","))
+            map(lambda x: x.strip(), fd.readline()[len("finals:") :].split(","))
         )
         letters = set(
-            map(lambda x: x.strip(), lines.pop(0)[len("letters:") :].split(","))
+            map(lambda x: x.strip(), fd.readline()[len("letters:") :].split(","))
         )
         states = set(
-            map(lambda x: x.strip(), lines.pop(0)[len("states:") :].split(","))
+            map(lambda x: x.strip(), fd.readline()[len("states:") :].split(","))
         )
         rules = {}
-        for line_no, line in enumerate(lines):
-            elements = line.split(",")
-            dst = elements.pop(0)
+        for line_no, line in enumerate(fd):
+            line = line.rstrip("\r\n")
+            if len(line) == 0:
+                continue
+            dst, letter, *elements = line.split(",")
             assert dst in states, (
                 f"loading at line{3 + line_no}: state: '{dst}' not declared beforehand!"
             )
-            letter = elements.pop(0)
             assert letter in letters, (
                 f"loading at line{3 + line_no}: letter: '{letter}' not declared beforehand!"
             )
@@ -106,24 +295,22 @@ def load_automaton_from_str(data: str, format: AutomatonFormat) -> DFTA[str, str
             rules[(letter, args)] = dst
         return DFTA(rules, set(finals))
     elif format == AutomatonFormat.EBNF:
-        data = data.replace("\n", " ")
         terminal_chars = ['"', "'"]
-        elements = data.split(";")
         rules = {}
         finals = set()
-        for element in elements:
+
+        def parse_element(element: str) -> None:
             rules_for_nonterminals = [
                 x.strip() for x in element.split("=") if len(x.strip()) > 0
             ]
             if len(rules_for_nonterminals) <= 1:
-                continue
-            dst = rules_for_nonterminals.pop(0).strip()
+                return
+            dst = rules_for_nonterminals[0].strip()
             finals.add(dst)
-            for sub_rule in "=".join(rules_for_nonterminals).split("|"):
-                sub_elements = [
+            for sub_rule in "=".join(rules_for_nonterminals[1:]).split("|"):
+                terminal, *sub_elements = [
                     x.strip() for x in sub_rule.split(",") if len(x.strip()) > 0
                 ]
-                terminal = sub_elements.pop(0).strip()
                 assert any(
                     terminal.startswith(c) and terminal.endswith(c)
                     for c in terminal_chars
@@ -132,10 +319,20 @@ def load_automaton_from_str(data: str, format: AutomatonFormat) -> DFTA[str, str
                 )
                 args = tuple(map(lambda x: x.strip(), sub_elements))
                 rules[(terminal[1:-1], args)] = dst
+
+        # Elements end with ';' and may span multiple lines
+        parts: List[str] = []
+        for line in fd:
+            *complete, rest = line.replace("\n", " ").split(";")
+            for part in complete:
+                parts.append(part)
+                parse_element("".join(parts))
+                parts.clear()
+            parts.append(rest)
+        parse_element("".join(parts))
         return DFTA(rules, finals)
     elif format == AutomatonFormat.LARK:
         terminal_chars = ['"', "'"]
-        elements = data.splitlines()
         rules = {}
         finals = set()
         last_state = None
@@ -147,11 +344,11 @@ def load_automaton_from_str(data: str, format: AutomatonFormat) -> DFTA[str, str
             return len(content)
 
         def parse_rule(rule: str, state: str):
-            elements = rule.split(" ")
+            elements = deque(rule.split(" "))
             to_add = []
             stack = []
             while elements:
-                element = elements.pop(0).strip()
+                element = elements.popleft().strip()
                 if len(element) == 0:
                     continue
                 if any(element.startswith(letter) for letter in terminal_chars):
@@ -159,7 +356,7 @@ def load_automaton_from_str(data: str, format: AutomatonFormat) -> DFTA[str, str
                     stack.append(element[1:end])
                     rest = element[end + 1 :].strip()
                     if len(rest) > 0:
-                        elements.insert(0, rest)
+                        elements.appendleft(rest)
                 elif element.startswith("..") and len(stack) > 0:
                     other_terminal = element[3 : parse_terminal(element[3:])]
                     previous = stack.pop()
@@ -179,7 +376,7 @@ def load_automaton_from_str(data: str, format: AutomatonFormat) -> DFTA[str, str
             for key in to_add:
                 rules[key] = state
 
-        for element in elements:
+        for element in fd:
             element = element.strip()
             if ":" in element:
                 # We are defining a new rule
@@ -0,0 +1,355 @@
+from array import array
+from bisect import bisect_left
+from collections import defaultdict
+from itertools import product, repeat
+from typing import Dict, Generator, Generic, List, Optional, Tuple, TypeVar
+
+from grape.automaton.tree_automaton import DFTA
+from grape.automaton.tree_counter import TreeCounter
+
+U = TypeVar("U")
+V = TypeVar("V")
+W = TypeVar("W")
+
+# Type code of all integer tables
+ID_TYPECODE = "i"
+
+
+class CompactDFTA(Generic[U, V]):
+    """
+    Integer interned deterministic finite tree automaton.
+
+    States and letters are interned to dense integer ids,
+    rules are stored by arity in flat arrays:
+        - letters[k][i]: letter of the i-th rule of arity k
+        - args[k][i * k : (i + 1) * k]: arguments of the i-th rule of arity k
+        - dsts[k][i]: destination of the i-th rule of arity k
+    """
+
+    def __init__(
+        self,
+        states: List[U],
+        letters: List[V],
+        finals: array,
+        tables: Dict[int, Tuple[array, array, array]],
+    ) -> None:
+        self.state_names = states
+        self.letter_names = letters
+        self.finals = finals
+        self.tables = tables
+        self._index: Optional[Dict[Tuple[int, Tuple[int, ...]], int]] = None
+        self._counter: Optional[TreeCounter[int]] = None
+        self._state_ids: Optional[Dict[U, int]] = None
+        self._letter_ids: Optional[Dict[V, int]] = None
+
+    @staticmethod
+    def from_dfta(dfta: DFTA[U, V]) -> "CompactDFTA[U, V]":
+        """
+        Intern the states and letters of the given DFTA.
+        Ids follow the order of first appearance in the rules of the DFTA.
+        """
+        state_ids: Dict[U, int] = {}
+        letter_ids: Dict[V, int] = {}
+
+        def state_id(state: U) -> int:
+            sid = state_ids.get(state)
+            if sid is None:
+                sid = len(state_ids)
+                state_ids[state] = sid
+            return sid
+
+        tables: Dict[int, Tuple[array, array, array]] = {}
+        for (letter, args), dst in dfta.rules.items():
+            lid = letter_ids.get(letter)
+            if lid is None:
+                lid = len(letter_ids)
+                letter_ids[letter] = lid
+            arity = len(args)
+            if arity not in tables:
+                tables[arity] = (
+                    array(ID_TYPECODE),
+                    array(ID_TYPECODE),
+                    array(ID_TYPECODE),
+                )
+            letters, flat_args, dsts = tables[arity]
+            letters.append(lid)
+            flat_args.extend(state_id(arg) for arg in args)
+            dsts.append(state_id(dst))
+        finals = array(ID_TYPECODE, sorted(state_id(q) for q in dfta.finals))
+        return CompactDFTA(list(state_ids), list(letter_ids), finals, tables)
+
+    def to_dfta(self) -> DFTA[U, V]:
+        """
+        Produces the equivalent DFTA with the original states and letters.
+        """
+        states = self.state_names
+        letters = self.letter_names
+        rules = {}
+        for arity, (rule_letters, flat_args, dsts) in self.tables.items():
+            names = map(states.__getitem__, flat_args)
+            # Group consecutive arguments by arity
+            all_args = zip(*[names] * arity) if arity > 0 else repeat((), len(dsts))
+            for letter, args, dst in zip(rule_letters, all_args, dsts):
+                rules[(letters[letter], args)] = states[dst]
+        return DFTA(rules, {states[q] for q in self.finals})
+
+    def to_int_dfta(self) -> DFTA[int, int]:
+        """
+        Produces the equivalent DFTA whose states and letters are the interned ids.
+        """
+        return DFTA(dict(self.__iter_rules__()), set(self.finals))
+
+    def __iter_rules__(
+        self,
+    ) -> Generator[Tuple[Tuple[int, Tuple[int, ...]], int], None, None]:
+        for arity, (letters, flat_args, dsts) in self.tables.items():
+            for i, (letter, dst) in enumerate(zip(letters, dsts)):
+                yield (letter, tuple(flat_args[i * arity : (i + 1) * arity])), dst
+
+    def size(self) -> int:
+        """
+        Return the size of the DFTA which is the number of rules.
+        """
+        return sum(len(dsts) for _, __, dsts in self.tables.values())
+
+    def state_id(self, state: U) -> int:
+        if self._state_ids is None:
+            self._state_ids = {q: i for i, q in enumerate(self.state_names)}
+        return self._state_ids[state]
+
+    def letter_id(self, letter: V) -> int:
+        if self._letter_ids is None:
+            self._letter_ids = {l: i for i, l in enumerate(self.letter_names)}
+        return self._letter_ids[letter]
+
+    def read(self, letter: int, children: Tuple[int, ...]) -> Optional[int]:
+        """
+        Works on ids, see letter_id and state_id to obtain them.
+        """
+        if self._index is None:
+            self._index = dict(self.__iter_rules__())
+        return self._index.get((letter, children), None)
+
+    def __reachable__(self) -> bytearray:
+        """
+        Bottom-up reachable states, with one counter of unsatisfied arguments per rule.
+        """
+        reachable = bytearray(len(self.state_names))
+        missing: Dict[int, array] = {}
+        consumers: Dict[int, List[Tuple[int, int]]] = defaultdict(list)
+        queue: List[int] = []
+        for arity, (_, flat_args, dsts) in self.tables.items():
+            if arity == 0:
+                for dst in dsts:
+                    if not reachable[dst]:
+                        reachable[dst] = 1
+                        queue.append(dst)
+                continue
+            missing[arity] = array(ID_TYPECODE, [arity]) * len(dsts)
+            for pos, arg in enumerate(flat_args):
+                consumers[arg].append((arity, pos // arity))
+        while queue:
+            state = queue.pop()
+            for arity, rule in consumers[state]:
+                counters = missing[arity]
+                counters[rule] -= 1
+                if counters[rule] == 0:
+                    dst = self.tables[arity][2][rule]
+                    if not reachable[dst]:
+                        reachable[dst] = 1
+                        queue.append(dst)
+        return reachable
+
+    def __productive__(self, allowed: bytearray) -> bytearray:
+        """
+        States from which a final state can be reached using only allowed states.
+        """
+        productive = bytearray(len(self.state_names))
+        producers: Dict[int, List[Tuple[int, int]]] = defaultdict(list)
+        for arity, (_, __, dsts) in self.tables.items():
+            if arity == 0:
+                continue
+            for rule, dst in enumerate(dsts):
+                producers[dst].append((arity, rule))
+        queue = [q for q in self.finals if allowed[q]]
+        for q in queue:
+            productive[q] = 1
+        while queue:
+            state = queue.pop()
+            for arity, rule in producers[state]:
+                flat_args = self.tables[arity][1]
+                args = flat_args[rule * arity : (rule + 1) * arity]
+                if not all(allowed[arg] for arg in args):
+                    continue
+                for arg in args:
+                    if not productive[arg]:
+                        productive[arg] = 1
+                        queue.append(arg)
+        return productive
+
+    def reduce(self) -> None:
+        """
+        Removes unreachable states and unproductive states.
+        Ids of states and letters are kept.
+        """
+        reachable = self.__reachable__()
+        useful = self.__productive__(reachable)
+        tables: Dict[int, Tuple[array, array, array]] = {}
+        for arity, (letters, flat_args, dsts) in self.tables.items():
+            new_letters, new_args, new_dsts = (
+                array(ID_TYPECODE),
+                array(ID_TYPECODE),
+                array(ID_TYPECODE),
+            )
+            for rule, (letter, dst) in enumerate(zip(letters, dsts)):
+                args = flat_args[rule * arity : (rule + 1) * arity]
+                if useful[dst] and all(useful[arg] for arg in args):
+                    new_letters.append(letter)
+                    new_args.extend(args)
+                    new_dsts.append(dst)
+            if len(new_dsts) > 0:
+                tables[arity] = (new_letters, new_args, new_dsts)
+        self.tables = tables
+        self.finals = array(ID_TYPECODE, [q for q in self.finals if useful[q]])
+        self._index = None
+        self._counter = None
+
+    def minimise(self) -> "CompactDFTA[U, V]":
+        """
+        Assumes this is a reduced DFTA.
+        Each equivalence class is represented by its smallest state id.
+        """
+        minimised = self.to_int_dfta().minimise(lambda cls: min(cls))
+        out = CompactDFTA.from_dfta(minimised)
+        # Rename to keep original names and letter ids
+        mapping = array(ID_TYPECODE, out.state_names)
+        letter_mapping = array(ID_TYPECODE, out.letter_names)
+        for letters, flat_args, dsts in out.tables.values():
+            for i in range(len(letters)):
+                letters[i] = letter_mapping[letters[i]]
+            for i in range(len(flat_args)):
+                flat_args[i] = mapping[flat_args[i]]
+            for i in range(len(dsts)):
+                dsts[i] = mapping[dsts[i]]
+        for i in range(len(out.finals)):
+            out.finals[i] = mapping[out.finals[i]]
+        return CompactDFTA(self.state_names, self.letter_names, out.finals, out.tables)
+
+    def product(
+        self, other: "CompactDFTA[W, V]", union: bool = False
+    ) -> Tuple["CompactDFTA[Tuple[U, W], V]", int]:
+        """
+        Returns the reduced product automaton along with the number of product states built.
+        Letters are matched by name, letter ids of self are kept and product states
+        get their ids in the order in which they are reached bottom-up.
+        If union is True then a product state is final iff one of its states is final,
+        otherwise it is final iff both its states are final.
+        """
+        other_ids = {letter: i for i, letter in enumerate(other.letter_names)}
+        other_letters = [other_ids.get(letter, -1) for letter in self.letter_names]
+        # state of self -> (arity, rule, index) of rules consuming it
+        consumers: Dict[int, List[Tuple[int, int, int]]] = defaultdict(list)
+        for arity, (_, flat_args, __) in self.tables.items():
+            for pos, arg in enumerate(flat_args):
+                consumers[arg].append((arity, pos // arity, pos % arity))
+        pairs: List[Tuple[int, int]] = []
+        pair_ids: Dict[Tuple[int, int], int] = {}
+        # state of self -> sorted ids of the reached pairs containing it
+        by_left: Dict[int, List[int]] = defaultdict(list)
+        tables: Dict[int, Tuple[array, array, array]] = {}
+
+        def add(arity: int, letter: int, args: Tuple[int, ...], pair: Tuple[int, int]):
+            pid = pair_ids.get(pair)
+            if pid is None:
+                pid = len(pairs)
+                pair_ids[pair] = pid
+                pairs.append(pair)
+                by_left[pair[0]].append(pid)
+            if arity not in tables:
+                tables[arity] = (
+                    array(ID_TYPECODE),
+                    array(ID_TYPECODE),
+                    array(ID_TYPECODE),
+                )
+            letters, flat_args, dsts = tables[arity]
+            letters.append(letter)
+            flat_args.extend(args)
+            dsts.append(pid)
+
+        if 0 in self.tables:
+            for letter, dst in zip(self.tables[0][0], self.tables[0][2]):
+                other_dst = other.read(other_letters[letter], ())
+                if other_dst is not None:
+                    add(0, letter, (), (dst, other_dst))
+        # pairs is the queue: when pid is processed, build the rules whose greatest
+        # argument is pid, at the first index where it appears, so each rule is built once
+        pid = 0
+        while pid < len(pairs):
+            for arity, rule, k in consumers[pairs[pid][0]]:
+                rule_letters, flat_args, dsts = self.tables[arity]
+                letter = rule_letters[rule]
+                if other_letters[letter] < 0:
+                    continue
+                choices = []
+                for i, arg in enumerate(flat_args[rule * arity : (rule + 1) * arity]):
+                    reached = by_left[arg]
+                    if i < k:
+                        choices.append(reached[: bisect_left(reached, pid)])
+                    elif i == k:
+                        choices.append([pid])
+                    else:
+                        choices.append(reached[: bisect_left(reached, pid + 1)])
+                for args in product(*choices):
+                    other_dst = other.read(
+                        other_letters[letter], tuple(pairs[q][1] for q in args)
+                    )
+                    if other_dst is not None:
+                        add(arity, letter, args, (dsts[rule], other_dst))
+            pid += 1
+        left_finals = set(self.finals)
+        right_finals = set(other.finals)
+        finals = array(
+            ID_TYPECODE,
+            [
+                pid
+                for pid, (left, right) in enumerate(pairs)
+                if (
+                    (left in left_finals or right in right_finals)
+                    if union
+                    else (left in left_finals and right in right_finals)
+                )
+            ],
+        )
+        states = [(self.state_names[l], other.state_names[r]) for l, r in pairs]
+        out = CompactDFTA(states, list(self.letter_names), finals, tables)
+        out.reduce()
+        return out, len(pairs)
+
+    def counter(self) -> TreeCounter[int]:
+        """
+        Cached counter of trees by state id and by size.
+        """
+        if self._counter is None:
+            self._counter = TreeCounter(
+                (args, dst) for (_, args), dst in self.__iter_rules__()
+            )
+        return self._counter
+
+    def stream_trees_by_size(
+        self, size: int, finals_only: bool = True
+    ) -> Generator[Tuple[int, int], None, None]:
+        """
+        Return the number of trees produced of all sizes until the given size (included).
+        stream (size, number of trees)
+        """
+        accepted = self.finals if finals_only else range(len(self.state_names))
+        yield from self.counter().stream(size, accepted)
+
+    def trees_by_size(self, size: int, finals_only: bool = True) -> Dict[int, int]:
+        """
+        Return the number of trees produced of all sizes until the given size (included).
+        """
+        return {
+            size: count
+            for size, count in self.stream_trees_by_size(size, finals_only=finals_only)
+        }
@@ -252,7 +252,8 @@ def add_loops(
                 state_to_size[dst] = 1
                 state_to_letter[dst] = (dst, True)
                 max_varno += 1
-        new_dfta.refresh_reversed_rules()
+        # Merges are looked for in the automaton without the added loops
+        base_dfta = new_dfta.copy()
         merge_memory = {}
         largest_merge = {}
         states_by_types_and_letter = defaultdict(list)
@@ -302,7 +303,7 @@ def add_loops(
                 ):
                     assert key not in new_dfta.rules
                     new_state = __find_merge__(
-                        new_dfta,
+                        base_dfta,
                         P,
                         combi,
                         states_by_types_and_letter[(rtype, P)],
@@ -157,7 +157,7 @@ def despecialize(
                 return letter
 
     out = grammar.map_alphabet(update)
-    out.finals = out.all_states
+    out.finals = set(out.all_states)
     out.reduce()
     return out
 
@@ -1,9 +1,14 @@
 from collections import defaultdict
+from dataclasses import dataclass
 from typing import (
+    AbstractSet,
+    Any,
     Callable,
     Dict,
+    FrozenSet,
     Generator,
     Generic,
+    Iterable,
     List,
     Literal,
     Optional,
@@ -13,13 +18,178 @@ from typing import (
     Union,
     overload,
 )
+import heapq
 import itertools
-from grape.partitions import integer_partitions
+from grape.automaton.tree_counter import LogTreeCounter, TreeCounter
+from grape.program import Function, Program, letter_to_program
+from grape.sampler import Sampler
 
 U = TypeVar("U")
 V = TypeVar("V")
 W = TypeVar("W")
 X = TypeVar("X")
+TD = TypeVar("TD", bound="TrackedDict")
+TS = TypeVar("TS", bound="TrackedSet")
+
+
+# Global counter so that two different objects never share a version
+__versions__ = itertools.count(1)
+
+
+class TrackedDict(dict):
+    """
+    Dictionary whose version changes at each mutation.
+    """
+
+    version: int = 0
+
+    def __init__(self, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self.version = next(__versions__)
+
+    def __touch__(self) -> None:
+        self.version = next(__versions__)
+
+    def __setitem__(self, key, value) -> None:
+        super().__setitem__(key, value)
+        self.__touch__()
+
+    def __delitem__(self, key) -> None:
+        super().__delitem__(key)
+        self.__touch__()
+
+    def __or__(self, other: Any) -> dict:
+        # Results of binary operators are plain dicts
+        return super().__or__(other)
+
+    def __ior__(self: TD, other: Any) -> TD:
+        out = super().__ior__(other)
+        self.__touch__()
+        return out
+
+    def pop(self, *args):
+        out = super().pop(*args)
+        self.__touch__()
+        return out
+
+    def popitem(self):
+        out = super().popitem()
+        self.__touch__()
+        return out
+
+    def clear(self) -> None:
+        super().clear()
+        self.__touch__()
+
+    def update(self, *args, **kwargs) -> None:
+        super().update(*args, **kwargs)
+        self.__touch__()
+
+    def setdefault(self, key, default=None):
+        out = super().setdefault(key, default)
+        self.__touch__()
+        return out
+
+
+class TrackedSet(set):
+    """
+    Set whose version changes at each mutation.
+    """
+
+    version: int = 0
+
+    def __init__(self, *args) -> None:
+        super().__init__(*args)
+        self.version = next(__versions__)
+
+    def __touch__(self) -> None:
+        self.version = next(__versions__)
+
+    def add(self, element) -> None:
+        super().add(element)
+        self.__touch__()
+
+    def discard(self, element) -> None:
+        super().discard(element)
+        self.__touch__()
+
+    def remove(self, element) -> None:
+        super().remove(element)
+        self.__touch__()
+
+    def pop(self):
+        out = super().pop()
+        self.__touch__()
+        return out
+
+    def clear(self) -> None:
+        super().clear()
+        self.__touch__()
+
+    def update(self, *others) -> None:
+        super().update(*others)
+        self.__touch__()
+
+    def intersection_update(self, *others) -> None:
+        super().intersection_update(*others)
+        self.__touch__()
+
+    def difference_update(self, *others) -> None:
+        super().difference_update(*others)
+        self.__touch__()
+
+    def symmetric_difference_update(self, other) -> None:
+        super().symmetric_difference_update(other)
+        self.__touch__()
+
+    def __or__(self, other: AbstractSet[Any]) -> set:
+        # Results of binary operators are plain sets
+        return super().__or__(other)
+
+    def __ior__(self: TS, other: AbstractSet[Any]) -> TS:
+        out = super().__ior__(other)
+        self.__touch__()
+        return out
+
+    def __iand__(self: TS, other: AbstractSet[object]) -> TS:
+        out = super().__iand__(other)
+        self.__touch__()
+        return out
+
+    def __isub__(self: TS, other: AbstractSet[object]) -> TS:
+        out = super().__isub__(other)
+        self.__touch__()
+        return out
+
+    def __xor__(self, other: AbstractSet[Any]) -> set:
+        # Results of binary operators are plain sets
+        return super().__xor__(other)
+
+    def __ixor__(self: TS, other: AbstractSet[Any]) -> TS:
+        out = super().__ixor__(other)
+        self.__touch__()
+        return out
+
+
+def __partition_of__(state2cls: Dict[U, int]) -> Set[FrozenSet[U]]:
+    classes: Dict[int, Set[U]] = defaultdict(set)
+    for q, i in state2cls.items():
+        classes[i].add(q)
+    return {frozenset(states) for states in classes.values()}
+
+
+@dataclass
+class StronglyConnectedComponents(Generic[U]):
+    """
+    Strongly connected components of the graph where each state points to its arguments.
+    Components are in topological order: a component only consumes states of itself or of previous components.
+    """
+
+    components: List[Tuple[U, ...]]
+    # state -> index of its component
+    component_of: Dict[U, int]
+    # component index -> contains a cycle
+    cyclic: List[bool]
 
 
 class DFTA(Generic[U, V]):
@@ -42,21 +212,66 @@ class DFTA(Generic[U, V]):
     ) -> None:
         self.finals = {s for s in sorted(finals, key=str)}
         self.rules = {k: rules[k] for k in sorted(rules, key=str)}
-        self.reversed_rules: Dict[
-            U,
-            List[
-                Tuple[
-                    V,
-                    Tuple[U, ...],
-                ]
-            ],
-        ] = {}
-        self.refresh_reversed_rules()
+        self._cache: Dict[str, Tuple[Tuple[int, int], Any]] = {}
+
+    @property
+    def rules(self) -> Dict[Tuple[V, Tuple[U, ...]], U]:
+        return self._rules
+
+    @rules.setter
+    def rules(self, rules: Dict[Tuple[V, Tuple[U, ...]], U]) -> None:
+        self._rules = TrackedDict(rules)
+
+    @property
+    def finals(self) -> Set[U]:
+        return self._finals
+
+    @finals.setter
+    def finals(self, finals: Set[U]) -> None:
+        self._finals = TrackedSet(finals)
+
+    def __cached__(
+        self, name: str, compute: Callable[[], X], uses_finals: bool = False
+    ) -> X:
+        """
+        Derived properties are cached until rules (or finals if they are used) are modified.
+        """
+        version = (self._rules.version, self._finals.version if uses_finals else 0)
+        entry = self._cache.get(name)
+        if entry is None or entry[0] != version:
+            entry = (version, compute())
+            self._cache[name] = entry
+        return entry[1]
+
+    @property
+    def reversed_rules(
+        self,
+    ) -> Dict[
+        U,
+        List[
+            Tuple[
+                V,
+                Tuple[U, ...],
+            ]
+        ],
+    ]:
+        """
+        state -> rules producing this state.
+        """
+
+        def compute():
+            reversed_rules = defaultdict(list)
+            for r, s in self.rules.items():
+                reversed_rules[s].append(r)
+            return reversed_rules
+
+        return self.__cached__("reversed_rules", compute)
 
     def refresh_reversed_rules(self) -> None:
-        self.reversed_rules = defaultdict(list)
-        for r, s in self.rules.items():
-            self.reversed_rules[s].append(r)
+        """
+        Not needed anymore: derived properties are refreshed when rules or finals are modified.
+        """
+        self._cache.clear()
 
     def copy(self) -> "DFTA[U, V]":
         """Produces a shallow copy of this automaton."""
@@ -76,51 +291,195 @@ class DFTA(Generic[U, V]):
         return sum(len(args) + 1 for _, args in self.rules.keys())
 
     @property
-    def states(self) -> Set[U]:
+    def states(self) -> FrozenSet[U]:
         """
         The set of reachable states.
         """
-        reachable = set()
-        added = True
-        rules = defaultdict(list)
+        return self.__cached__("states", lambda: frozenset(self.__reachable__()))
+
+    def __reachable__(self) -> Set[U]:
+        """
+        Each rule keeps a counter of its arguments that are not yet reachable,
+        a rule fires when its counter reaches 0.
+        """
+        reachable: Set[U] = set()
+        queue: List[U] = []
+        missing: List[int] = []
+        dsts: List[U] = []
+        consumers: Dict[U, List[int]] = defaultdict(list)
         for (_, args), dst in self.rules.items():
-            rules[dst].append(args)
-        while added:
-            added = False
-            for dst in list(rules.keys()):
-                for args in rules[dst]:
-                    if all(s in reachable for s in args):
+            if len(args) == 0:
+                if dst not in reachable:
+                    reachable.add(dst)
+                    queue.append(dst)
+            else:
+                for arg in args:
+                    consumers[arg].append(len(dsts))
+                missing.append(len(args))
+                dsts.append(dst)
+        while queue:
+            for rule in consumers[queue.pop()]:
+                missing[rule] -= 1
+                if missing[rule] == 0:
+                    dst = dsts[rule]
+                    if dst not in reachable:
                         reachable.add(dst)
-                        added = True
-                        del rules[dst]
-                        break
+                        queue.append(dst)
         return reachable
 
     @property
-    def all_states(self) -> Set[U]:
+    def all_states(self) -> FrozenSet[U]:
         """
         The set of all states.
         """
-        reachable = set()
-        for (_, args), dst in self.rules.items():
-            reachable.add(dst)
-            for arg in args:
-                reachable.add(arg)
-        return reachable
+
+        def compute():
+            all_states = set()
+            for (_, args), dst in self.rules.items():
+                all_states.add(dst)
+                for arg in args:
+                    all_states.add(arg)
+            return frozenset(all_states)
+
+        return self.__cached__("all_states", compute)
 
     @property
-    def alphabet(self) -> Set[V]:
+    def alphabet(self) -> FrozenSet[V]:
         """
         The set of letters.
         """
-        alphabet = set()
-        for (letter, _), __ in self.rules.items():
-            alphabet.add(letter)
-        return alphabet
+        return self.__cached__(
+            "alphabet", lambda: frozenset(letter for letter, _ in self.rules)
+        )
 
     def read(self, letter: V, children: Tuple[U, ...]) -> Optional[U]:
         return self.rules.get((letter, children), None)
 
+    def __letters_by_name__(self) -> Dict[str, V]:
+        return self.__cached__(
+            "letters_by_name", lambda: {str(P): P for P in self.alphabet}
+        )
+
+    def run(
+        self, program: Program, memo: Optional[Dict[Program, Optional[U]]] = None
+    ) -> Optional[U]:
+        """
+        Returns the state reached by reading the given program bottom-up, None if it cannot be read.
+        Nodes are matched to letters by their string representation.
+        memo: subprogram -> reached state, it can be shared between calls on this automaton.
+        """
+        if memo is None:
+            memo = {}
+        letters = self.__letters_by_name__()
+
+        def visit(node: Program) -> Optional[U]:
+            if node in memo:
+                return memo[node]
+            match node:
+                case Function(function, arguments):
+                    letter = letters.get(str(function))
+                    out = None
+                    children: List[U] = []
+                    for arg in arguments:
+                        child = visit(arg)
+                        if child is None:
+                            break
+                        children.append(child)
+                    else:
+                        if letter is not None:
+                            out = self.rules.get((letter, tuple(children)))
+                case _:
+                    letter = letters.get(str(node))
+                    out = None if letter is None else self.rules.get((letter, ()))
+            memo[node] = out
+            return out
+
+        return visit(program)
+
+    def run_many(self, programs: Iterable[Program]) -> List[Optional[U]]:
+        """
+        Returns the state reached by each program, see run.
+        Shared subprograms are read only once across the whole batch.
+        """
+        memo: Dict[Program, Optional[U]] = {}
+        return [self.run(program, memo) for program in programs]
+
+    def accepts_many(self, programs: Iterable[Program]) -> List[bool]:
+        """
+        Returns for each program whether it is accepted, see run_many.
+        """
+        return [state in self.finals for state in self.run_many(programs)]
+
+    def is_subset_of(self, other: "DFTA[W, X]") -> Tuple[bool, Optional[Program]]:
+        """
+        Returns (true iff all programs accepted by this automaton are accepted by other, a smallest counterexample if any).
+        The product with other is explored by increasing program size and stops at the first counterexample.
+        Letters are matched by name, see run.
+        """
+        other_letters = other.__letters_by_name__()
+        # state -> (rule, index) of rules consuming state at index
+        consumers: Dict[U, List[Tuple[Tuple[V, Tuple[U, ...]], int]]] = defaultdict(
+            list
+        )
+        for rule in self.rules:
+            for k, arg in enumerate(rule[1]):
+                consumers[arg].append((rule, k))
+        # (state, state of other or None) -> (size, letter, arguments) of the smallest tree found
+        best: Dict[Tuple[U, Optional[W]], Tuple[int, V, tuple]] = {}
+        done: Set[Tuple[U, Optional[W]]] = set()
+        # state -> done pairs with this state
+        done_by_state: Dict[U, List[Tuple[U, Optional[W]]]] = defaultdict(list)
+        heap: List[Tuple[int, int, Tuple[U, Optional[W]]]] = []
+        order = itertools.count()
+
+        def push(P: V, pair_args: tuple, size: int) -> None:
+            dst1 = self.rules[(P, tuple(q1 for q1, _ in pair_args))]
+            letter = other_letters.get(str(P))
+            args2 = tuple(q2 for _, q2 in pair_args)
+            if letter is None or any(q2 is None for q2 in args2):
+                dst2 = None
+            else:
+                dst2 = other.rules.get((letter, args2))
+            dst = (dst1, dst2)
+            if dst not in done and (dst not in best or best[dst][0] > size):
+                best[dst] = (size, P, pair_args)
+                heapq.heappush(heap, (size, next(order), dst))
+
+        def witness(pair: Tuple[U, Optional[W]]) -> Program:
+            _, P, pair_args = best[pair]
+            if len(pair_args) == 0:
+                return letter_to_program(P)
+            return Function(letter_to_program(P), [witness(arg) for arg in pair_args])
+
+        for P, args in self.rules:
+            if len(args) == 0:
+                push(P, (), 1)
+        while heap:
+            size, _, pair = heapq.heappop(heap)
+            if pair in done:
+                continue
+            done.add(pair)
+            if pair[0] in self.finals and pair[1] not in other.finals:
+                return False, witness(pair)
+            done_by_state[pair[0]].append(pair)
+            for (P, args), k in consumers[pair[0]]:
+                choices = [
+                    [pair] if j == k else done_by_state[arg]
+                    for j, arg in enumerate(args)
+                ]
+                for pair_args in itertools.product(*choices):
+                    push(P, pair_args, 1 + sum(best[arg][0] for arg in pair_args))
+        return True, None
+
+    def is_equivalent(self, other: "DFTA[W, X]") -> Tuple[bool, Optional[Program]]:
+        """
+        Returns (true iff both automata accept the same programs, a counterexample if any), see is_subset_of.
+        """
+        included, counterexample = self.is_subset_of(other)
+        if not included:
+            return included, counterexample
+        return other.is_subset_of(self)
+
     def __remove_unreachable__(self) -> None:
         new_states = self.states
         new_rules = {
@@ -131,66 +490,144 @@ class DFTA(Generic[U, V]):
         self.rules = new_rules
         self.finals = self.finals.intersection(new_states)
 
+    @staticmethod
     def __product_rules__(
-        self, other: "DFTA[W, V]"
-    ) -> Dict[
-        Tuple[
-            V,
-            Tuple[tuple[U, W], ...],
-        ],
-        tuple[U, W],
-    ]:
-        new_rules: Dict[
-            Tuple[
-                V,
-                Tuple[tuple[U, W], ...],
-            ],
-            tuple[U, W],
-        ] = {}
-        for (P1, args1), dst1 in self.rules.items():
-            for (P2, args2), dst2 in other.rules.items():
-                if P1 != P2 or len(args1) != len(args2):
-                    continue
-                new_args = tuple((a1, a2) for a1, a2 in zip(args1, args2))
-                new_rules[(P1, new_args)] = (dst1, dst2)
+        dftas: List["DFTA[Any, V]"],
+    ) -> Dict[Tuple[V, Tuple[Tuple[Any, ...], ...]], Tuple[Any, ...]]:
+        """
+        Rules of the product of all given automata, states are flat tuples.
+        Only builds product states that are reachable bottom-up.
+        Rules are matched by (letter, arity, argument index) buckets.
+        """
+        new_rules: Dict[Tuple[V, Tuple[Tuple[Any, ...], ...]], Tuple[Any, ...]] = {}
+        # state -> (letter, arity, index) -> rules consuming state at index
+        consumers: List[Dict[Any, Dict[Tuple[V, int, int], List[Tuple[V, tuple]]]]] = []
+        for dfta in dftas:
+            cons: Dict[Any, Dict[Tuple[V, int, int], List[Tuple[V, tuple]]]] = (
+                defaultdict(lambda: defaultdict(list))
+            )
+            for P, args in dfta.rules:
+                for k, arg in enumerate(args):
+                    cons[arg][(P, len(args), k)].append((P, args))
+            consumers.append(cons)
+        reached: Set[Tuple[Any, ...]] = set()
+        # projections[i]: states of the i-th automaton that appear in a reached state
+        projections: List[Set[Any]] = [set() for _ in dftas]
+        queue: List[Tuple[Any, ...]] = []
+
+        def add(letter: V, args: Tuple[Tuple[Any, ...], ...], dst: Tuple[Any, ...]):
+            new_rules[(letter, args)] = dst
+            if dst not in reached:
+                reached.add(dst)
+                queue.append(dst)
+                for i, q in enumerate(dst):
+                    projections[i].add(q)
+
+        # Leaves
+        leaves: List[Dict[V, Any]] = [
+            {P: dst for (P, args), dst in dfta.rules.items() if len(args) == 0}
+            for dfta in dftas
+        ]
+        for P in leaves[0]:
+            if all(P in other for other in leaves[1:]):
+                add(P, (), tuple(other[P] for other in leaves))
+        while queue:
+            state = queue.pop()
+            keys = set(consumers[0][state[0]])
+            for i in range(1, len(dftas)):
+                keys &= consumers[i][state[i]].keys()
+            for key in keys:
+                k = key[2]
+                candidates = [
+                    [
+                        S
+                        for S in consumers[i][q][key]
+                        if all(arg in projections[i] for arg in S[1])
+                    ]
+                    for i, q in enumerate(state)
+                ]
+                for combination in itertools.product(*candidates):
+                    new_args = tuple(zip(*(S[1] for S in combination)))
+                    if any(
+                        arg not in reached for j, arg in enumerate(new_args) if j != k
+                    ):
+                        continue
+                    dst = tuple(dfta.rules[S] for dfta, S in zip(dftas, combination))
+                    add(key[0], new_args, dst)
         return new_rules
 
-    def read_intersection(self, other: "DFTA[W, V]") -> "DFTA[tuple[U, W], V]":
-        new_finals = set(el for el in itertools.product(self.finals, other.finals))
-        d = DFTA(self.__product_rules__(other), new_finals)
+    @staticmethod
+    def product_many(
+        dftas: List["DFTA[Any, V]"], union: bool = False
+    ) -> Tuple["DFTA[Tuple[Any, ...], V]", int]:
+        """
+        Returns the reduced product automaton of all given automata
+        along with the number of product states built.
+        States are flat tuples with one state per automaton.
+        If union is True then a product state is final iff one of its states is final,
+        otherwise it is final iff all its states are final.
+        """
+        rules = DFTA.__product_rules__(dftas)
+        built = set(rules.values())
+        combine = any if union else all
+        new_finals = {
+            state
+            for state in built
+            if combine(q in dfta.finals for q, dfta in zip(state, dftas))
+        }
+        d = DFTA(rules, new_finals)
         d.reduce()
-        return d
+        return d, len(built)
+
+    def product(
+        self, other: "DFTA[W, V]", union: bool = False
+    ) -> Tuple["DFTA[tuple[U, W], V]", int]:
+        """
+        Returns the reduced product automaton along with the number of product states built.
+        If union is True then a product state is final iff one of its states is final,
+        otherwise it is final iff both its states are final.
+        """
+        return DFTA.product_many([self, other], union)  # type: ignore
+
+    def read_intersection(self, other: "DFTA[W, V]") -> "DFTA[tuple[U, W], V]":
+        return self.product(other)[0]
 
     def read_union(self, other: "DFTA[W, V]") -> "DFTA[tuple[U, W], V]":
-        new_finals = set(
-            el for el in itertools.product(self.finals, other.states)
-        ) | set(el for el in itertools.product(self.states, other.finals))
-        d = DFTA(self.__product_rules__(other), new_finals)
-        d.reduce()
-        return d
+        return self.product(other, union=True)[0]
+
+    @staticmethod
+    def read_intersection_many(
+        dftas: List["DFTA[Any, V]"],
+    ) -> "DFTA[Tuple[Any, ...], V]":
+        return DFTA.product_many(dftas)[0]
+
+    @staticmethod
+    def read_union_many(dftas: List["DFTA[Any, V]"]) -> "DFTA[Tuple[Any, ...], V]":
+        return DFTA.product_many(dftas, union=True)[0]
 
     def __get_consumed__(self) -> Set[U]:
+        """
+        The set of states that can be consumed to produce a final state.
+        """
+        producers: Dict[U, List[Tuple[U, ...]]] = defaultdict(list)
+        for (_, args), dst in self.rules.items():
+            if len(args) > 0:
+                producers[dst].append(args)
         consumed: Set[U] = {q for q in self.finals}
         new_elems = list(consumed)
         while new_elems:
             dst = new_elems.pop()
-            for (_, args), pot_dst in self.rules.items():
-                if dst == pot_dst:
-                    for arg in args:
-                        if arg not in consumed:
-                            new_elems.append(arg)
+            for args in producers.pop(dst, []):
+                for arg in args:
+                    if arg not in consumed:
                         consumed.add(arg)
+                        new_elems.append(arg)
         return consumed
 
     def __remove_unproductive__(self) -> None:
-        removed = True
-        while removed:
-            removed = False
-            consumed = self.__get_consumed__()
-            for S, dst in list(self.rules.items()):
-                if dst not in consumed:
-                    del self.rules[S]
-                    removed = True
+        # Removed rules do not produce consumed states so consumed states do not change
+        consumed = self.__get_consumed__()
+        self.rules = {S: dst for S, dst in self.rules.items() if dst in consumed}
 
     def reduce(self) -> None:
         """
@@ -198,13 +635,13 @@ class DFTA(Generic[U, V]):
         """
         self.__remove_unreachable__()
         self.__remove_unproductive__()
-        self.refresh_reversed_rules()
 
     @overload
     def minimise(
         self,
         mapping: Callable[[Tuple[U, ...]], W],
         can_be_merged: Callable[[U, U], bool] = lambda x, y: True,
+        cross_check: bool = False,
     ) -> "DFTA[W, V]":
         pass
 
@@ -213,6 +650,7 @@ class DFTA(Generic[U, V]):
         self,
         mapping: Literal[None] = None,
         can_be_merged: Callable[[U, U], bool] = lambda x, y: True,
+        cross_check: bool = False,
     ) -> "DFTA[Tuple[U, ...], V]":
         pass
 
@@ -220,10 +658,237 @@ class DFTA(Generic[U, V]):
         self,
         mapping: Union[Literal[None], Callable[[Tuple[U, ...]], W]] = None,
         can_be_merged: Callable[[U, U], bool] = lambda x, y: True,
+        cross_check: bool = False,
     ) -> "Union[DFTA[Tuple[U, ...], V], DFTA[W, V]]":
         """
         Assumes this is a reduced DTFA.
         Mapping is used to map states equivalence classes to new identifiers if given like map_states.
+        Equivalence classes are given to mapping as tuples of states sorted by str.
+        Only states for which can_be_merged holds are merged, it must be transitive.
+
+        Equivalence classes are computed by partition refinement, see equivalence_classes.
+        If cross_check is True, they are also computed with Brainerd's algorithm
+        and an AssertionError is raised if they differ.
+        """
+        state2cls = self.equivalence_classes(can_be_merged)
+        if cross_check:
+            expected = self.__brainerd_classes__(can_be_merged)
+            assert __partition_of__(state2cls) == __partition_of__(expected), (
+                "minimisation: partition refinement and Brainerd's algorithm disagree"
+            )
+        return self.quotient(state2cls, mapping)
+
+    def quotient(
+        self,
+        state2cls: Dict[U, int],
+        mapping: Union[Literal[None], Callable[[Tuple[U, ...]], W]] = None,
+    ) -> "Union[DFTA[Tuple[U, ...], V], DFTA[W, V]]":
+        """
+        Merge states that are in the same class.
+        Mapping is used to map classes (tuples of states sorted by str) to new identifiers.
+        """
+        cls2states: Dict[int, List[U]] = defaultdict(list)
+        for q in sorted(state2cls, key=str):
+            cls2states[state2cls[q]].append(q)
+        f = mapping or (lambda x: x)  # type: ignore
+        new_states = {i: f(tuple(states)) for i, states in cls2states.items()}
+        new_rules = {}
+        for (l, args), dst in self.rules.items():
+            t_args = tuple([new_states[state2cls[q]] for q in args])
+            new_rules[(l, t_args)] = new_states[state2cls[dst]]
+        return DFTA(new_rules, {new_states[state2cls[q]] for q in self.finals})  # type: ignore
+
+    def __contexts__(
+        self,
+    ) -> Tuple[Dict[U, List[Tuple[int, U]]], Dict[U, Set[U]]]:
+        """
+        A context is a rule where a consumed state has been removed: (letter, index, other args).
+        Returns:
+            - state -> list of (context id, destination) sorted by context id
+            - state -> set of states consumed by rules going to this state
+        """
+        context_ids: Dict[Tuple[V, int, Tuple[U, ...]], int] = {}
+        consumed_by: Dict[U, List[Tuple[int, U]]] = {q: [] for q in self.states}
+        dependents: Dict[U, Set[U]] = defaultdict(set)
+        for (P, args), dst in self.rules.items():
+            for k, arg in enumerate(args):
+                context = (P, k, args[:k] + args[k + 1 :])
+                cid = context_ids.setdefault(context, len(context_ids))
+                consumed_by[arg].append((cid, dst))
+                dependents[dst].add(arg)
+        for contexts in consumed_by.values():
+            contexts.sort(key=lambda x: x[0])
+        return consumed_by, dependents
+
+    def __refine__(
+        self,
+        state2cls: Dict[U, int],
+        cls2states: List[List[U]],
+        dirty: Set[int],
+        consumed_by: Dict[U, List[Tuple[int, U]]],
+        dependents: Dict[U, Set[U]],
+        can_be_merged: Callable[[U, U], bool],
+    ) -> None:
+        """
+        Refine in place the partition until it is stable, assumes all states of a class have the same contexts.
+        Only dirty classes are checked, a class is dirty when one of its states has a context
+        going into a state that changed class.
+        When a class is split, its largest part keeps the identifier of the class.
+        can_be_merged is only checked against one representative per class,
+        so it must be transitive for the classes to be well defined.
+        """
+
+        def split(i: int, parts: List[List[U]]) -> None:
+            parts.sort(key=len, reverse=True)
+            cls2states[i] = parts[0]
+            for part in parts[1:]:
+                n = len(cls2states)
+                cls2states.append(part)
+                for q in part:
+                    state2cls[q] = n
+                for q in part:
+                    for consumed in dependents[q]:
+                        dirty.add(state2cls[consumed])
+            dirty.add(i)
+
+        while dirty:
+            while dirty:
+                i = dirty.pop()
+                if len(cls2states[i]) <= 1:
+                    continue
+                signatures: Dict[Tuple[int, ...], List[U]] = defaultdict(list)
+                for q in cls2states[i]:
+                    signature = tuple(state2cls[dst] for _, dst in consumed_by[q])
+                    signatures[signature].append(q)
+                if len(signatures) > 1:
+                    split(i, list(signatures.values()))
+            # Enforce can_be_merged with each class representative,
+            # the last state of the class like in Brainerd's algorithm
+            for i in range(len(cls2states)):
+                cls = cls2states[i]
+                parts = []
+                while cls:
+                    representative = cls[-1]
+                    part = [representative]
+                    rest = []
+                    for q in cls[:-1]:
+                        if can_be_merged(representative, q):
+                            part.append(q)
+                        else:
+                            rest.append(q)
+                    parts.append(part)
+                    cls = rest
+                if len(parts) > 1:
+                    split(i, parts)
+
+    def equivalence_classes(
+        self, can_be_merged: Callable[[U, U], bool] = lambda x, y: True
+    ) -> Dict[U, int]:
+        """
+        Assumes this is a reduced DTFA.
+        Returns state -> equivalence class identifier for the coarsest congruence.
+
+        Two states are equivalent iff they can be consumed in the same contexts and each context leads to equivalent states.
+        Computed by partition refinement on signatures,
+        starting with classes of states that have the same finality and contexts.
+        """
+        consumed_by, dependents = self.__contexts__()
+        state2cls: Dict[U, int] = {}
+        cls2states: List[List[U]] = []
+        key2cls: Dict[Tuple[bool, Tuple[int, ...]], int] = {}
+        for q in sorted(consumed_by, key=str):
+            key = (q in self.finals, tuple(cid for cid, _ in consumed_by[q]))
+            i = key2cls.get(key)
+            if i is None:
+                i = len(cls2states)
+                key2cls[key] = i
+                cls2states.append([])
+            cls2states[i].append(q)
+            state2cls[q] = i
+        self.__refine__(
+            state2cls,
+            cls2states,
+            set(range(len(cls2states))),
+            consumed_by,
+            dependents,
+            can_be_merged,
+        )
+        return state2cls
+
+    def update_equivalence_classes(
+        self,
+        previous: Dict[U, int],
+        changed_rules: Iterable[Tuple[V, Tuple[U, ...]]],
+        changed_finals: Iterable[U] = (),
+        can_be_merged: Callable[[U, U], bool] = lambda x, y: True,
+    ) -> Dict[U, int]:
+        """
+        Assumes this is a reduced DTFA.
+        previous: equivalence classes (see equivalence_classes) of this automaton before some rules
+        were added, removed or redirected and some states changed finality.
+        changed_rules: (letter, args) of these rules, including rules removed by reduce.
+
+        Returns the same classes as equivalence_classes.
+        Only states whose contexts may lead to a changed rule or state are affected,
+        their classes are merged with previous classes sharing the same finality and contexts
+        and only these merged classes are refined.
+        """
+        consumed_by, dependents = self.__contexts__()
+        # States consumed by changed rules or new states or states that changed finality
+        # and transitively states consumed by rules producing an affected state
+        stack: List[U] = [arg for _, args in changed_rules for arg in args]
+        stack += changed_finals
+        stack += [q for q in consumed_by if q not in previous]
+        affected: Set[U] = set()
+        while stack:
+            q = stack.pop()
+            if q in affected or q not in consumed_by:
+                continue
+            affected.add(q)
+            stack.extend(dependents[q])
+
+        def key_of(q: U) -> Tuple[bool, Tuple[int, ...]]:
+            return (q in self.finals, tuple(cid for cid, _ in consumed_by[q]))
+
+        cls2states: List[List[U]] = []
+        key2cls: Dict[Tuple[bool, Tuple[int, ...]], int] = {}
+        for q in sorted(affected, key=str):
+            key = key_of(q)
+            i = key2cls.get(key)
+            if i is None:
+                i = len(cls2states)
+                key2cls[key] = i
+                cls2states.append([])
+            cls2states[i].append(q)
+        dirty = set(key2cls.values())
+        # Unaffected states keep their previous equivalences
+        kept: Dict[int, List[U]] = defaultdict(list)
+        for q in consumed_by:
+            if q not in affected:
+                kept[previous[q]].append(q)
+        for states in kept.values():
+            i = key2cls.get(key_of(states[0]))
+            if i is None:
+                cls2states.append(states)
+            else:
+                cls2states[i] += states
+        state2cls = {q: i for i, states in enumerate(cls2states) for q in states}
+        self.__refine__(
+            state2cls,
+            cls2states,
+            dirty,
+            consumed_by,
+            dependents,
+            can_be_merged,
+        )
+        return state2cls
+
+    def __brainerd_classes__(
+        self, can_be_merged: Callable[[U, U], bool] = lambda x, y: True
+    ) -> Dict[U, int]:
+        """
+        Assumes this is a reduced DTFA.
+        Returns state -> equivalence class identifier.
 
         Adapted algorithm from:
         Brainerd, Walter S.. “The Minimalization of Tree Automata.” Inf. Control. 13 (1968): 484-491.
@@ -320,12 +985,7 @@ class DFTA(Generic[U, V]):
                         # i is a free slot since other classes are added at the end
                         cls2states[i] = tuple(new_cls)
 
-        f = mapping or (lambda x: x)  # type: ignore
-        new_rules = {}
-        for (l, args), dst in self.rules.items():
-            t_args = tuple([f(cls2states[state2cls[q]]) for q in args])
-            new_rules[(l, t_args)] = f(cls2states[state2cls[dst]])
-        return DFTA(new_rules, {f(cls2states[state2cls[q]]) for q in self.finals})  # type: ignore
+        return state2cls
 
     def map_states(self, mapping: Callable[[U], X]) -> "DFTA[X, V]":
         return DFTA(
@@ -355,6 +1015,15 @@ class DFTA(Generic[U, V]):
             self.finals.copy(),
         )
 
+    def counter(self) -> TreeCounter[U]:
+        """
+        Cached counter of trees by state and by size.
+        """
+        return self.__cached__(
+            "counter",
+            lambda: TreeCounter((args, dst) for (_, args), dst in self.rules.items()),
+        )
+
     def stream_trees_by_size(
         self, size: int, finals_only: bool = True
     ) -> Generator[tuple[int, int], None, None]:
@@ -362,24 +1031,31 @@ class DFTA(Generic[U, V]):
         Return the number of trees produced of all sizes until the given size (included).
         stream (size, number of trees)
         """
+        accepted = self.finals if finals_only else self.states
+        yield from self.counter().stream(size, accepted)
 
-        states = self.states
-        accepted = self.finals if finals_only else states
-        count: dict[U, dict[int, int]] = {state: {} for state in states}
-        for csize in range(1, size + 1):
-            for state in states:
-                count[state][csize] = 0
-                for derivation in self.reversed_rules[state]:
-                    _, args = derivation
-                    if len(args) == 0 and csize == 1:
-                        count[state][csize] += 1
-                    elif len(args) > 0:
-                        for partition in integer_partitions(len(args), csize - 1):
-                            total = 1
-                            for arg_size, arg in zip(partition, args):
-                                total *= count[arg][arg_size]
-                            count[state][csize] += total
-            yield csize, sum(count[state][csize] for state in accepted)
+    def log10_trees_by_size(
+        self, size: int, finals_only: bool = True
+    ) -> dict[int, float]:
+        """
+        Return the approximate log10 of the number of trees produced of all sizes until the given size (included).
+        -inf means that no tree is produced.
+        Computed with float64 in log space, vectorised with NumPy if it is installed.
+        """
+        counter = LogTreeCounter((args, dst) for (_, args), dst in self.rules.items())
+        accepted = self.finals if finals_only else self.states
+        return {size: log10 for size, log10 in counter.stream(size, accepted)}
+
+    def trees_by_state(self, size: int) -> dict[U, dict[int, int]]:
+        """
+        Return for each state the number of trees it produces of all sizes until the given size (included).
+        """
+        counter = self.counter()
+        counter.extend(size)
+        return {
+            state: {s: counter.counts[state][s] for s in range(1, size + 1)}
+            for state in self.states
+        }
 
     def trees_by_size(self, size: int, finals_only: bool = True) -> dict[int, int]:
         """
@@ -405,51 +1081,112 @@ class DFTA(Generic[U, V]):
     def max_arity(self) -> int:
         return max(len(args) for _, args in self.rules)
 
+    def scc(self) -> "StronglyConnectedComponents[U]":
+        """
+        Strongly connected components of the graph where each state points to its arguments.
+        """
+        return self.__cached__("scc", self.__tarjan__)
+
+    def __tarjan__(self) -> "StronglyConnectedComponents[U]":
+        """
+        Iterative Tarjan, components are emitted after all components they consume.
+        """
+        successors: Dict[U, List[U]] = defaultdict(list)
+        for (_, args), dst in self.rules.items():
+            successors[dst].extend(args)
+        index: Dict[U, int] = {}
+        lowlink: Dict[U, int] = {}
+        on_stack: Set[U] = set()
+        stack: List[U] = []
+        components: List[Tuple[U, ...]] = []
+        cyclic: List[bool] = []
+        for root in sorted(self.all_states, key=str):
+            if root in index:
+                continue
+            index[root] = lowlink[root] = len(index)
+            stack.append(root)
+            on_stack.add(root)
+            work = [(root, iter(successors[root]))]
+            while work:
+                node, todo = work[-1]
+                for succ in todo:
+                    if succ not in index:
+                        index[succ] = lowlink[succ] = len(index)
+                        stack.append(succ)
+                        on_stack.add(succ)
+                        work.append((succ, iter(successors[succ])))
+                        break
+                    elif succ in on_stack:
+                        lowlink[node] = min(lowlink[node], index[succ])
+                else:
+                    work.pop()
+                    if work:
+                        parent = work[-1][0]
+                        lowlink[parent] = min(lowlink[parent], lowlink[node])
+                    if lowlink[node] == index[node]:
+                        component = []
+                        while True:
+                            q = stack.pop()
+                            on_stack.discard(q)
+                            component.append(q)
+                            if q == node:
+                                break
+                        components.append(tuple(component))
+                        cyclic.append(len(component) > 1 or node in successors[node])
+        component_of = {q: i for i, c in enumerate(components) for q in c}
+        return StronglyConnectedComponents(components, component_of, cyclic)
+
+    def __sampler__(self) -> Sampler[U, V]:
+        return self.__cached__("sampler", lambda: Sampler(self), uses_finals=True)
+
+    def unrank(self, size: int, index: int) -> Program:
+        """
+        Returns the program of the given size accepted by this automaton with the given index in [0, trees_at_size(size)).
+        """
+        return self.__sampler__().unrank(size, index)
+
+    def rank(self, program: Program) -> int:
+        """
+        Returns the index of the given accepted program among accepted programs of its size, inverse of unrank.
+        """
+        states: Dict[Program, Optional[U]] = {}
+        self.run(program, states)
+        return self.__sampler__().rank(program, states)
+
     def is_unbounded(self) -> bool:
         """
         Returns true if the grammar produces unbounded programs.
         """
-        reachable_from: dict[U, set[U]] = defaultdict(set)
-        for (P, args), dst in self.rules.items():
-            reachable_from[dst].update(args)
-
-        updated = True
-        while updated:
-            updated = False
-            for dst, reachables in reachable_from.copy().items():
-                before = len(reachables)
-                for S in reachables.copy():
-                    if dst in reachable_from[S]:
-                        return True
-                    reachables.update(reachable_from[S])
-                if len(reachables) != before:
-                    updated = True
-        return False
+        return any(self.scc().cyclic)
 
     def compute_max_size_and_depth(self) -> tuple[int, int]:
         """
-        Return max size and max depth, this will loop endlessly if this grammar is unbounded.
+        Return max size and max depth, raises a ValueError if this grammar is unbounded.
         """
-        max_size_by_state: dict[U, int] = {state: 0 for state in self.states}
-        max_depth_by_state: dict[U, int] = {state: 0 for state in self.states}
-        for (P, args), dst in self.rules.items():
-            if len(args) == 0:
-                max_size_by_state[dst] = 1
-                max_depth_by_state[dst] = 1
-        updated = True
-        while updated:
-            previous_size = max_size_by_state.copy()
-            previous_depth = max_depth_by_state.copy()
-            for (P, args), dst in self.rules.items():
-                if len(args) > 0 and all(max_size_by_state[arg] > 0 for arg in args):
-                    size = sum(max_size_by_state[arg] for arg in args) + 1
-                    depth = max(max_depth_by_state[arg] for arg in args) + 1
-                    max_size_by_state[dst] = max(size, max_size_by_state[dst])
-                    max_depth_by_state[dst] = max(depth, max_depth_by_state[dst])
-            updated = (
-                previous_size != max_size_by_state
-                or previous_depth != max_depth_by_state
-            )
+        scc = self.scc()
+        reachable = self.states
+        max_size_by_state: dict[U, int] = {}
+        max_depth_by_state: dict[U, int] = {}
+        for component, cyclic in zip(scc.components, scc.cyclic):
+            if cyclic and any(q in reachable for q in component):
+                raise ValueError("grammar is unbounded")
+            # Acyclic components are single states whose arguments are already done
+            for dst in component:
+                if dst not in reachable:
+                    continue
+                size, depth = 0, 0
+                for _, args in self.reversed_rules[dst]:
+                    if all(arg in max_size_by_state for arg in args):
+                        size = max(
+                            size, sum(max_size_by_state[arg] for arg in args) + 1
+                        )
+                        depth = max(
+                            depth,
+                            max((max_depth_by_state[arg] for arg in args), default=0)
+                            + 1,
+                        )
+                max_size_by_state[dst] = size
+                max_depth_by_state[dst] = depth
 
         return max(max_size_by_state[f] for f in self.finals), max(
             max_depth_by_state[f] for f in self.finals
@@ -472,42 +1209,37 @@ class DFTA(Generic[U, V]):
         """
         Returns true iff a rule is unproductive (including unreachable).
         """
-        new_states = self.states
-        new_rules = {
-            (letter, args): dst
-            for (letter, args), dst in self.rules.items()
-            if dst in new_states and all(s in new_states for s in args)
-        }
-        if new_rules != self.rules:
+        reachable = self.__reachable__()
+        if any(
+            dst not in reachable or any(s not in reachable for s in args)
+            for (_, args), dst in self.rules.items()
+        ):
             return True
         consumed = self.__get_consumed__()
-        for _, dst in list(self.rules.items()):
-            if dst not in consumed:
-                return True
-
-        return False
+        return any(dst not in consumed for dst in self.rules.values())
 
     def __has_cloning_derivation__(self) -> bool:
-        # Compute transitive closure
-        reachable_from: dict[U, set[U]] = defaultdict(set)
-        for (P, args), dst in self.rules.items():
-            reachable_from[dst].update(args)
-
-        updated = True
-        while updated:
-            updated = False
-            for dst, reachables in reachable_from.copy().items():
-                before = len(reachables)
-                for S in reachables.copy():
-                    reachables.update(reachable_from[S])
-                if len(reachables) != before:
-                    updated = True
-                    if dst in reachables and any(
-                        len(args) > 1
-                        for S in reachables
-                        for _, args in self.reversed_rules[S]
+        """
+        True iff a state on a cycle derives (transitively) a rule with at least two arguments.
+        """
+        scc = self.scc()
+        # component -> a rule with at least two arguments is derivable from it
+        branching: List[bool] = []
+        for i, component in enumerate(scc.components):
+            out = False
+            for dst in component:
+                for _, args in self.reversed_rules[dst]:
+                    if len(args) > 1 or any(
+                        scc.component_of[arg] != i and branching[scc.component_of[arg]]
+                        for arg in args
                     ):
-                        return True
+                        out = True
+                        break
+                if out:
+                    break
+            branching.append(out)
+            if out and scc.cyclic[i]:
+                return True
         return False
 
     def is_tree_like(self) -> bool:
@@ -0,0 +1,270 @@
+from collections import defaultdict
+import math
+from typing import Dict, Generator, Generic, Iterable, List, Tuple, TypeVar
+
+try:
+    import numpy as np
+
+    HAS_NUMPY = True
+except ImportError:  # pragma: no cover
+    HAS_NUMPY = False
+
+U = TypeVar("U")
+
+
+class TreeCounter(Generic[U]):
+    """
+    Exact number of trees produced by each state for each size.
+
+    Rules are grouped by argument tuple, so that each distinct argument tuple is counted once.
+    The count vector of an argument tuple is the convolution of the count vector of its prefix
+    with the count vector of its last argument,
+    vectors of all prefixes are cached and shared between argument tuples.
+    Counts are extended incrementally one size at a time.
+    """
+
+    def __init__(self, derivations: Iterable[Tuple[Tuple[U, ...], U]]) -> None:
+        # state -> number of rules without arguments
+        self.leaves: Dict[U, int] = defaultdict(int)
+        # state -> argument tuple -> number of rules
+        self.derivations: Dict[U, Dict[Tuple[U, ...], int]] = defaultdict(
+            lambda: defaultdict(int)
+        )
+        states = set()
+        for args, dst in derivations:
+            states.add(dst)
+            states.update(args)
+            if len(args) == 0:
+                self.leaves[dst] += 1
+            else:
+                self.derivations[dst][args] += 1
+        # state -> size -> number of trees
+        self.counts: Dict[U, List[int]] = {state: [0] for state in states}
+        # argument tuple of length >= 2 -> size -> number of tuples of trees
+        self.products: Dict[Tuple[U, ...], List[int]] = {}
+        for by_args in self.derivations.values():
+            for args in by_args:
+                for j in range(2, len(args) + 1):
+                    self.products.setdefault(args[:j], [])
+        # Shorter prefixes first
+        self.prefixes = sorted(self.products, key=len)
+        self.max_size = 0
+
+    def tuple_counts(self, args: Tuple[U, ...]) -> List[int]:
+        """
+        size -> number of tuples of trees produced by the given argument tuple.
+        Only valid up to max_size.
+        """
+        if len(args) == 1:
+            return self.counts[args[0]]
+        return self.products[args]
+
+    def extend(self, size: int) -> None:
+        """
+        Compute counts until the given size (included).
+        """
+        while self.max_size < size:
+            self.__next_size__()
+
+    def __next_size__(self) -> None:
+        size = self.max_size + 1
+        # Products of arguments at size - 1 are needed
+        prev = size - 1
+        for args in self.prefixes:
+            prefix = self.tuple_counts(args[:-1])
+            last = self.counts[args[-1]]
+            # Each tree of the prefix has size at least len(args) - 1
+            total = 0
+            for x in range(1, prev - len(args) + 2):
+                c = last[x]
+                if c:
+                    total += prefix[prev - x] * c
+            self.products[args].append(total)
+        for state, state_counts in self.counts.items():
+            total = self.leaves.get(state, 0) if size == 1 else 0
+            if size > 1:
+                for args, multiplicity in self.derivations.get(state, {}).items():
+                    if len(args) <= prev:
+                        total += multiplicity * self.tuple_counts(args)[prev]
+            state_counts.append(total)
+        self.max_size = size
+
+    def count(self, state: U, size: int) -> int:
+        """
+        Number of trees of the given size produced by the given state.
+        """
+        self.extend(size)
+        counts = self.counts.get(state)
+        return 0 if counts is None else counts[size]
+
+    def stream(
+        self, size: int, states: Iterable[U]
+    ) -> Generator[Tuple[int, int], None, None]:
+        """
+        stream (size, number of trees produced by the given states) until the given size (included).
+        """
+        states = [q for q in states if q in self.counts]
+        for csize in range(1, size + 1):
+            self.extend(csize)
+            yield csize, sum(self.counts[q][csize] for q in states)
+
+
+def __log_sum_exp__(values: List[float]) -> float:
+    maxi = max(values, default=-math.inf)
+    if maxi == -math.inf:
+        return maxi
+    return maxi + math.log(sum(math.exp(v - maxi) for v in values))
+
+
+class LogTreeCounter(Generic[U]):
+    """
+    Approximate number of trees produced by each state for each size, in log space.
+
+    Same dynamic programming as TreeCounter but on float64 logarithms,
+    so that magnitudes of very large sizes can be computed quickly.
+    If NumPy is available, each size is computed with vectorised operations
+    over the state x size matrix and the matrices of argument prefixes.
+    """
+
+    def __init__(
+        self,
+        derivations: Iterable[Tuple[Tuple[U, ...], U]],
+        use_numpy: bool = True,
+    ) -> None:
+        exact = TreeCounter(derivations)
+        self.use_numpy = use_numpy and HAS_NUMPY
+        self.states: List[U] = sorted(exact.counts, key=str)
+        self.state_index = {state: i for i, state in enumerate(self.states)}
+        self.leaves = [
+            (self.state_index[state], math.log(n)) for state, n in exact.leaves.items()
+        ]
+        # length -> prefixes of that length
+        self.prefixes: Dict[int, List[Tuple[U, ...]]] = defaultdict(list)
+        for args in exact.prefixes:
+            self.prefixes[len(args)].append(args)
+        self.prefix_index = {
+            args: i
+            for prefixes in self.prefixes.values()
+            for i, args in enumerate(prefixes)
+        }
+        # length -> list of (dst, argument tuple, log(multiplicity))
+        self.derivations: Dict[int, List[Tuple[int, int, float]]] = defaultdict(list)
+        for dst, by_args in exact.derivations.items():
+            for args, multiplicity in by_args.items():
+                self.derivations[len(args)].append(
+                    (
+                        self.state_index[dst],
+                        self.__row_of__(args),
+                        math.log(multiplicity),
+                    )
+                )
+        self.max_length = max(self.derivations, default=0)
+
+    def __row_of__(self, args: Tuple[U, ...]) -> int:
+        if len(args) == 1:
+            return self.state_index[args[0]]
+        return self.prefix_index[args]
+
+    def log_counts(self, size: int) -> List[List[float]]:
+        """
+        Returns state index -> size -> natural logarithm of the number of trees (-inf if there are none).
+        """
+        if self.use_numpy:
+            return self.__log_counts_numpy__(size).tolist()
+        return self.__log_counts_python__(size)
+
+    def __log_counts_python__(self, size: int) -> List[List[float]]:
+        inf = -math.inf
+        # length -> index -> size
+        tables: Dict[int, List[List[float]]] = {
+            1: [[inf] * (size + 1) for _ in self.states]
+        }
+        for length, prefixes in self.prefixes.items():
+            tables[length] = [[inf] * (size + 1) for _ in prefixes]
+        counts = tables[1]
+        for csize in range(1, size + 1):
+            prev = csize - 1
+            for length in range(2, self.max_length + 1):
+                m = prev - length + 1
+                if m < 1:
+                    continue
+                for i, args in enumerate(self.prefixes[length]):
+                    prefix = tables[length - 1][self.__row_of__(args[:-1])]
+                    last = counts[self.state_index[args[-1]]]
+                    tables[length][i][prev] = __log_sum_exp__(
+                        [prefix[prev - x] + last[x] for x in range(1, m + 1)]
+                    )
+            values: Dict[int, List[float]] = defaultdict(list)
+            if csize == 1:
+                for state, log_n in self.leaves:
+                    values[state].append(log_n)
+            else:
+                for length, derivations in self.derivations.items():
+                    for dst, index, log_mult in derivations:
+                        values[dst].append(log_mult + tables[length][index][prev])
+            for state, state_values in values.items():
+                counts[state][csize] = __log_sum_exp__(state_values)
+        return counts
+
+    def __log_counts_numpy__(self, size: int):
+        inf = -np.inf
+        tables = {1: np.full((len(self.states), size + 1), inf)}
+        parents = {}
+        lasts = {}
+        for length, prefixes in self.prefixes.items():
+            tables[length] = np.full((len(prefixes), size + 1), inf)
+            parents[length] = np.array(
+                [self.__row_of__(args[:-1]) for args in prefixes], dtype=np.int64
+            )
+            lasts[length] = np.array(
+                [self.state_index[args[-1]] for args in prefixes], dtype=np.int64
+            )
+        rules = {
+            length: (
+                np.array([dst for dst, _, __ in derivations], dtype=np.int64),
+                np.array([index for _, index, __ in derivations], dtype=np.int64),
+                np.array([log_mult for _, __, log_mult in derivations]),
+            )
+            for length, derivations in self.derivations.items()
+        }
+        counts = tables[1]
+        with np.errstate(invalid="ignore", divide="ignore"):
+            for state, log_n in self.leaves:
+                counts[state, 1] = np.logaddexp(counts[state, 1], log_n)
+            for csize in range(2, size + 1):
+                prev = csize - 1
+                for length in range(2, self.max_length + 1):
+                    m = prev - length + 1
+                    if m < 1 or length not in parents:
+                        continue
+                    # terms[i, x - 1] = prefix[i, prev - x] + last[i, x]
+                    prefix = tables[length - 1][parents[length], prev - m : prev]
+                    last = counts[lasts[length], 1 : m + 1]
+                    terms = prefix[:, ::-1] + last
+                    maxi = terms.max(axis=1)
+                    finite = np.isfinite(maxi)
+                    out = np.full(len(maxi), inf)
+                    out[finite] = maxi[finite] + np.log(
+                        np.exp(terms[finite] - maxi[finite, None]).sum(axis=1)
+                    )
+                    tables[length][:, prev] = out
+                column = counts[:, csize]
+                for length, (dsts, indices, log_mults) in rules.items():
+                    np.logaddexp.at(
+                        column, dsts, log_mults + tables[length][indices, prev]
+                    )
+        return counts
+
+    def stream(
+        self, size: int, states: Iterable[U]
+    ) -> Generator[Tuple[int, float], None, None]:
+        """
+        stream (size, log10 of the number of trees produced by the given states) until the given size (included).
+        """
+        counts = self.log_counts(size)
+        indices = [self.state_index[q] for q in states if q in self.state_index]
+        for csize in range(1, size + 1):
+            yield (
+                csize,
+                __log_sum_exp__([counts[i][csize] for i in indices]) / math.log(10),
+            )
@@ -1,9 +1,25 @@
 import argparse
+import math
 from grape.automaton.automaton_manager import load_automaton_from_file
 from grape.automaton.spec_manager import specialize
 from grape.cli import dsl_loader
 
 
+def format_log10(log10: float) -> str:
+    """
+    Scientific notation of 10 ** log10 with 2 decimals, such as 1.23e+45.
+    """
+    if not math.isfinite(log10):
+        return "0"
+    exponent = math.floor(log10)
+    mantissa = round(10 ** (log10 - exponent), 2)
+    # Rounding may carry into the exponent, 9.999 is 10.00
+    if mantissa >= 10:
+        mantissa /= 10
+        exponent += 1
+    return f"{mantissa:.2f}e+{exponent:02d}"
+
+
 def parse_args():
     parser = argparse.ArgumentParser(
         description="Count the number of programs at the specified constraints",
@@ -26,6 +42,11 @@ def parse_args():
         required=False,
         help="specialized type request",
     )
+    parser.add_argument(
+        "--approx",
+        action="store_true",
+        help="only compute the order of magnitude, fast for large sizes",
+    )
     parser.add_argument(
         "--dsl",
         type=str,
@@ -42,9 +63,21 @@ def main():
     if str(args.request) != "None":
         dfta = specialize(dfta, args.request, dsl)
         dfta.reduce()
-    size = int(args.size)
+    max_size = int(args.size)
+    if args.approx:
+        cumulative = -math.inf
+        for size, log10 in dfta.log10_trees_by_size(max_size).items():
+            high, low = max(cumulative, log10), min(cumulative, log10)
+            if math.isfinite(low):
+                cumulative = high + math.log10(1 + 10 ** (low - high))
+            else:
+                cumulative = high
+            print(
+                f"size {size}: ~{format_log10(log10)} cumulative: ~{format_log10(cumulative)}"
+            )
+        return
     cumulative = 0
-    for size, count in dfta.stream_trees_by_size(size):
+    for size, count in dfta.stream_trees_by_size(max_size):
         cumulative += count
         print(f"size {size}: {count:.2e} cumulative: {cumulative:.2e}")
 
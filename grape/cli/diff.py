@@ -0,0 +1,52 @@
+import argparse
+from grape.automaton.automaton_manager import load_automaton_from_file
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Compare the programs accepted by two grammars",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+    )
+
+    parser.add_argument(
+        "first",
+        type=str,
+        help="first automaton file",
+    )
+    parser.add_argument(
+        "second",
+        type=str,
+        help="second automaton file",
+    )
+    parser.add_argument(
+        "--size", type=int, default=7, help="max size of programs to compare"
+    )
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    first = load_automaton_from_file(args.first)
+    second = load_automaton_from_file(args.second)
+    for name, a, b in [("first", first, second), ("second", second, first)]:
+        included, counterexample = a.is_subset_of(b)
+        if included:
+            print(f"{name} is included in the other")
+        else:
+            print(
+                f"{name} is not included in the other, counterexample: {counterexample}"
+            )
+    common = first.read_intersection(second)
+    counts = zip(
+        first.stream_trees_by_size(args.size),
+        second.stream_trees_by_size(args.size),
+        common.stream_trees_by_size(args.size),
+    )
+    for (size, n1), (_, n2), (__, n12) in counts:
+        print(
+            f"size {size}: first: {n1} second: {n2} only first: {n1 - n12} only second: {n2 - n12}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,30 @@
 import argparse
+from collections import deque
+import itertools
+import json
+from multiprocessing import Pool
+from multiprocessing.pool import AsyncResult
+import sys
+from typing import Callable, Deque, Generator, Iterable, Optional, Tuple
 from grape.automaton.automaton_manager import load_automaton_from_file
 from grape.enumerator import Enumerator
+from grape.program import Program
+from grape.program_stream import ProgramEncoder
+from grape.sampler import Sampler
+
+FORMATS = ["text", "jsonl", "binary"]
+# Number of programs per write
+BATCH = 1 << 16
+
+
+def __parse_shard__(content: str) -> Tuple[int, int]:
+    try:
+        index, total = map(int, content.split("/"))
+    except ValueError as e:
+        raise argparse.ArgumentTypeError("shard must be given as i/N") from e
+    if not 0 <= index < total:
+        raise argparse.ArgumentTypeError("shard i/N must satisfy 0 <= i < N")
+    return index, total
 
 
 def parse_args():
@@ -17,22 +41,154 @@ def parse_args():
     parser.add_argument(
         "--size", type=int, default=7, help="max size of programs to check"
     )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="number of processes enumerating in parallel",
+    )
+    parser.add_argument(
+        "--shard",
+        type=__parse_shard__,
+        default=None,
+        help="only enumerate the i-th of N disjoint parts, given as i/N",
+    )
+    parser.add_argument(
+        "--format",
+        choices=FORMATS,
+        default=FORMATS[0],
+        help="output format, binary is a stream of opcodes, see grape.program_stream",
+    )
+    parser.add_argument(
+        "--count-only",
+        action="store_true",
+        help="only print the number of programs, without enumerating them",
+    )
 
     return parser.parse_args()
 
 
+def __formatter__(
+    format: str, encoder: ProgramEncoder
+) -> Callable[[Iterable[Program]], bytes]:
+    if format == "binary":
+        return encoder.encode_many
+    if format == "jsonl":
+        return lambda programs: "".join(
+            json.dumps({"program": str(program)}) + "\n" for program in programs
+        ).encode()
+    return lambda programs: "".join(f"{program}\n" for program in programs).encode()
+
+
+def __write_all__(
+    programs: Iterable[Program], formatter: Callable[[Iterable[Program]], bytes]
+) -> None:
+    out = sys.stdout.buffer
+    while True:
+        batch = list(itertools.islice(programs, BATCH))
+        if len(batch) == 0:
+            break
+        out.write(formatter(batch))
+
+
+# Sampler and formatter of each worker process
+__worker_sampler__: Optional[Sampler] = None
+__worker_formatter__: Optional[Callable[[Iterable[Program]], bytes]] = None
+
+
+def __init_worker__(automaton: str, format: str) -> None:
+    global __worker_sampler__, __worker_formatter__
+    dfta = load_automaton_from_file(automaton)
+    __worker_sampler__ = Sampler(dfta)
+    __worker_formatter__ = __formatter__(format, ProgramEncoder.from_dfta(dfta))
+
+
+def __enumerate_range__(task: Tuple[int, int, int]) -> bytes:
+    size, start, end = task
+    assert __worker_sampler__ is not None and __worker_formatter__ is not None
+    return __worker_formatter__(__worker_sampler__.programs(size, start, end))
+
+
+def __shard_range__(count: int, shard: Tuple[int, int]) -> Tuple[int, int]:
+    """
+    Contiguous index range of the shard among count programs.
+    """
+    index, total = shard
+    return count * index // total, count * (index + 1) // total
+
+
+def __tasks__(
+    sampler: Sampler, max_size: int, shard: Tuple[int, int]
+) -> Generator[Tuple[int, int, int], None, None]:
+    """
+    Split programs by (size, index range): the shard is a contiguous index range of each size,
+    which is then cut into ranges of at most BATCH programs.
+    """
+    for size in range(1, max_size + 1):
+        start, end = __shard_range__(sampler.count(size), shard)
+        for lo in range(start, end, BATCH):
+            yield size, lo, min(lo + BATCH, end)
+
+
 def main():
     args = parse_args()
     dfta = load_automaton_from_file(args.automaton)
+    shard = args.shard or (0, 1)
+    if args.count_only:
+        # Same programs as the enumeration, counted by size and index range
+        sampler = Sampler(dfta)
+        ranges = [
+            __shard_range__(sampler.count(size), shard)
+            for size in range(1, args.size + 1)
+        ]
+        print(sum(end - start for start, end in ranges))
+        return
+    encoder = ProgramEncoder.from_dfta(dfta)
+    formatter = __formatter__(args.format, encoder)
+    if args.format == "binary":
+        sys.stdout.buffer.write(encoder.header())
+    if args.workers > 1 or args.shard is not None:
+        # Programs are output by size then by index, see Sampler
+        sampler = Sampler(dfta)
+        if args.workers <= 1:
+            programs = (
+                program
+                for size, start, end in __tasks__(sampler, args.size, shard)
+                for program in sampler.programs(size, start, end)
+            )
+            __write_all__(programs, formatter)
+            return
+        tasks = __tasks__(sampler, args.size, shard)
+        with Pool(
+            args.workers,
+            initializer=__init_worker__,
+            initargs=(args.automaton, args.format),
+        ) as pool:
+            # Results are written in task order, workers may only run
+            # a bounded number of tasks ahead of the writer
+            pending: Deque[AsyncResult] = deque(
+                pool.apply_async(__enumerate_range__, (task,))
+                for task in itertools.islice(tasks, 2 * args.workers)
+            )
+            while pending:
+                sys.stdout.buffer.write(pending.popleft().get())
+                task = next(tasks, None)
+                if task is not None:
+                    pending.append(pool.apply_async(__enumerate_range__, (task,)))
+        return
 
     enumerator = Enumerator(dfta)
     gen = enumerator.enumerate_until_size(args.size + 1)
-    next(gen)
-    try:
-        while True:
-            print(gen.send(True))
-    except StopIteration:
-        pass
+
+    def all_programs():
+        try:
+            yield next(gen)
+            while True:
+                yield gen.send(True)
+        except StopIteration:
+            pass
+
+    __write_all__(all_programs(), formatter)
 
 
 if __name__ == "__main__":
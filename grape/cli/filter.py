@@ -0,0 +1,73 @@
+import argparse
+from contextlib import ExitStack
+import itertools
+import sys
+from grape.automaton.automaton_manager import load_automaton_from_file
+from grape.program import str_to_program
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Keep only the programs accepted by the grammar",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+    )
+
+    parser.add_argument(
+        "automaton",
+        type=str,
+        help="your automaton file",
+    )
+    parser.add_argument(
+        "programs",
+        type=str,
+        help="file with one program per line",
+    )
+    parser.add_argument(
+        "-o",
+        "--output",
+        type=str,
+        default=None,
+        help="output file, by default accepted programs are printed",
+    )
+    parser.add_argument(
+        "--rejected",
+        action="store_true",
+        help="keep rejected programs instead of accepted ones",
+    )
+    parser.add_argument(
+        "--batch",
+        type=int,
+        default=100000,
+        help="number of programs sharing the same memory of subprograms",
+    )
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    dfta = load_automaton_from_file(args.automaton)
+    total = 0
+    kept = 0
+    with ExitStack() as stack:
+        out = sys.stdout
+        if args.output is not None:
+            out = stack.enter_context(open(args.output, "w"))
+        fd = stack.enter_context(open(args.programs))
+        lines = (line.strip() for line in fd)
+        lines = (line for line in lines if len(line) > 0)
+        while True:
+            batch = list(itertools.islice(lines, args.batch))
+            if len(batch) == 0:
+                break
+            accepted = dfta.accepts_many(map(str_to_program, batch))
+            for line, is_accepted in zip(batch, accepted):
+                if is_accepted != args.rejected:
+                    out.write(line + "\n")
+                    kept += 1
+            total += len(batch)
+    if args.output is not None:
+        print(f"kept {kept} programs out of {total}")
+
+
+if __name__ == "__main__":
+    main()
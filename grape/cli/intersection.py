@@ -1,4 +1,5 @@
 import argparse
+from grape.automaton.tree_automaton import DFTA
 from grape.automaton.automaton_manager import (
     dump_automaton_to_file,
     load_automaton_from_file,
@@ -23,6 +24,12 @@ def parse_args():
         type=str,
         help="output file",
     )
+    parser.add_argument(
+        "--batch",
+        type=int,
+        default=0,
+        help="number of grammars combined in a single product pass, the result is minimised after each pass (0: all at once)",
+    )
     return parser.parse_args()
 
 
@@ -30,10 +37,13 @@ def main():
     args = parse_args()
 
     grammars = [load_automaton_from_file(file) for file in args.grammars]
-    out = grammars.pop()
+    batch = max(2, args.batch) if args.batch > 0 else len(grammars)
+    out = grammars.pop(0)
     while grammars:
-        out = out.read_intersection(grammars.pop())
-        out.reduce()
+        operands = [out] + grammars[: batch - 1]
+        grammars = grammars[batch - 1 :]
+        out, built = DFTA.product_many(operands)
+        print(f"product states built: {built} kept: {len(out.states)}")
         out = out.minimise()
     out = out.classic_state_renaming()
     dump_automaton_to_file(out, args.output)
@@ -10,6 +10,7 @@ from grape.automaton.automaton_manager import (
 from grape.automaton.loop_manager import LoopingAlgorithm, add_loops
 from grape.automaton.spec_manager import despecialize, type_request_from_specialized
 from grape.cli import dsl_loader
+from grape.enumerator import CombinationCache
 from grape.evaluator import Evaluator
 from grape.pruning.equivalence_class_manager import EquivalenceClassManager
 from grape.pruning.obs_equiv_pruner import prune
@@ -96,6 +97,45 @@ def parse_args():
         default=None,
         help="save equivalence classes ina JSON file",
     )
+    parser.add_argument(
+        "--columnar",
+        action="store_true",
+        help="evaluate programs on all inputs at once, with vectorised semantics if any",
+    )
+    parser.add_argument(
+        "--compact-memory",
+        action="store_true",
+        help="store enumerated programs compactly, slower but uses less memory",
+    )
+    parser.add_argument(
+        "--combination-cache",
+        choices=list(CombinationCache),
+        default=CombinationCache.ALL,
+        help="policy of the cache of combinations of subprograms",
+    )
+    parser.add_argument(
+        "--cache-mb",
+        type=int,
+        default=1024,
+        help="memory budget of the lru cache of combinations in MB",
+    )
+    parser.add_argument(
+        "--checkpoint-dir",
+        type=str,
+        default=None,
+        help="save the enumeration state in this directory at each completed size",
+    )
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="continue from the last completed size saved in the checkpoint directory",
+    )
+    parser.add_argument(
+        "--spill-dir",
+        type=str,
+        default=None,
+        help="store enumerated programs compactly in memory-mapped files in this directory",
+    )
 
     return parser.parse_args()
 
@@ -107,7 +147,9 @@ def main():
     )
     inputs = sample_inputs(args.samples, sample_dict, equal_dict)
 
-    evaluator = Evaluator(dsl, inputs, equal_dict, skip_exceptions)
+    evaluator = Evaluator(
+        dsl, inputs, equal_dict, skip_exceptions, columnar=args.columnar
+    )
     manager = EquivalenceClassManager()
     base_grammar = None
     base_aut_file: str = args.automaton or ""
@@ -120,6 +162,12 @@ def main():
         args.size,
         None,
         base_grammar,
+        args.compact_memory,
+        CombinationCache(args.combination_cache),
+        args.cache_mb * 2**20,
+        args.checkpoint_dir,
+        args.resume,
+        args.spill_dir,
     )
     type_req = type_request_from_specialized(reduced_grammar, dsl)
     loop_algorithm = args.strategy
@@ -0,0 +1,52 @@
+import argparse
+from contextlib import ExitStack
+import sys
+from grape.automaton.automaton_manager import load_automaton_from_file
+from grape.sampler import Sampler
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Sample programs of a given size uniformly at random",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+    )
+
+    parser.add_argument(
+        "automaton",
+        type=str,
+        help="your automaton file",
+    )
+    parser.add_argument("--size", type=int, default=7, help="size of programs")
+    parser.add_argument(
+        "-n", "--number", type=int, default=100, help="number of programs to sample"
+    )
+    parser.add_argument("--seed", type=int, default=1, help="seed of the sampler")
+    parser.add_argument(
+        "-o",
+        "--output",
+        type=str,
+        default=None,
+        help="output file, by default programs are printed",
+    )
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    dfta = load_automaton_from_file(args.automaton)
+    sampler = Sampler(dfta, seed=args.seed)
+    with ExitStack() as stack:
+        out = sys.stdout
+        if args.output is not None:
+            out = stack.enter_context(open(args.output, "w"))
+        # Sample by batches to bound memory
+        remaining = args.number
+        while remaining > 0:
+            batch = min(remaining, 10000)
+            for program in sampler.sample(args.size, batch):
+                out.write(f"{program}\n")
+            remaining -= batch
+
+
+if __name__ == "__main__":
+    main()
@@ -11,14 +11,30 @@ TYPE_SEP = "|@>"
 
 
 class DSL:
-    def __init__(self, dsl: dict[str, tuple[str, Callable] | Callable]):
+    """
+    Each primitive is given as (type, semantic), as (type, semantic, vectorised semantic)
+    or as an annotated function.
+    A vectorised semantic takes one column of values per argument (lists of the same length)
+    and returns the column of outputs, e.g. a NumPy ufunc.
+    """
+
+    def __init__(
+        self,
+        dsl: dict[
+            str, tuple[str, Callable] | tuple[str, Callable, Callable] | Callable
+        ],
+    ):
         self.primitives: dict[str, tuple[str, Callable]] = {}
         self.original_primitives: dict[str, str] = {}
         self.eval: dict[str, Callable] = {}
+        self.vectorized: dict[str, Callable] = {}
         self.to_merge: dict[Program, Program] = {}
 
         for name, item in sorted(dsl.items()):
-            if isinstance(item, tuple):
+            if isinstance(item, tuple) and len(item) == 3:
+                (stype, fn, vectorized_fn) = item
+                self.vectorized[name] = vectorized_fn
+            elif isinstance(item, tuple):
                 (stype, fn) = item
             else:
                 (stype, fn) = types.annotations_to_type_str(item), item
@@ -59,6 +75,13 @@ class DSL:
         else:
             return self.eval[primitive]
 
+    def vectorized_semantic(self, primitive: str) -> Callable | None:
+        """
+        Get the vectorised semantic of the specified primitive if there is one.
+        Works both with and without variants.
+        """
+        return self.vectorized.get(primitive.split(TYPE_SEP)[0])
+
     def get_state_types(self, automaton: DFTA[T, str | Program]) -> dict[T, str]:
         """
         Get a mapping from states to types.
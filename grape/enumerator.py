@@ -1,21 +1,91 @@
-from itertools import product
-from collections import defaultdict
-from typing import Any, Generator
-from grape.program import Program, Function, Variable
+from array import array
+from enum import StrEnum
+from heapq import heappop, heappush
+from itertools import count, product
+from collections import OrderedDict, defaultdict
+import io
+import mmap
+import os
+import pickle
+import sys
+import tempfile
+from typing import Any, Callable, Generator, Iterator
+from grape.program import Program, Function, Variable, str_to_program
 from grape.automaton.tree_automaton import DFTA
-from grape.partitions import integer_partitions
+from grape.partitions import integer_partitions_table
+
+
+class CombinationCache(StrEnum):
+    ALL = "all"
+    LRU = "lru"
+    NONE = "none"
 
 
 class Enumerator:
-    def __init__(self, grammar: DFTA[Any, Program]):
+    """
+    If compact is True, kept programs are not stored as Program objects
+    but as records (rule id, (size, index) of each child) in per (state, size) integer arrays.
+    Programs are then materialised when they are yielded or accessed through memory.
+
+    combination_cache is the policy for the combinations of arguments of each size:
+        - ALL: every list of combinations is kept
+        - LRU: lists are kept while their estimated total size is at most cache_bytes,
+          least recently used lists are evicted first
+        - NONE: combinations are always recomputed from memory
+    Hits and misses are counted in cache_hits and cache_misses.
+
+    If checkpoint_dir is given, the enumeration state is saved there at each completed size,
+    along with the value of checkpoint_extra() if given, see save_checkpoint.
+
+    If spill_dir is given, memory is compact and the layers of records of each completed size
+    are written to one file in a temporary directory of spill_dir and memory-mapped,
+    so that the OS page cache holds only the layers in use.
+    Combinations of arguments are then materialised one at a time.
+    Call close once memory is no longer needed to unmap the files and remove the directory.
+    """
+
+    def __init__(
+        self,
+        grammar: DFTA[Any, Program],
+        compact: bool = False,
+        combination_cache: CombinationCache = CombinationCache.ALL,
+        cache_bytes: int = 2**30,
+        checkpoint_dir: str | None = None,
+        checkpoint_extra: Callable[[], Any] | None = None,
+        spill_dir: str | None = None,
+    ):
         self.grammar = grammar
         self.states = sorted(self.grammar.states)
+        self.compact = compact or spill_dir is not None
+        self.spill: tempfile.TemporaryDirectory | None = None
+        if spill_dir is not None:
+            self.spill = tempfile.TemporaryDirectory(
+                dir=spill_dir, ignore_cleanup_errors=True
+            )
+        self.combination_cache = combination_cache
+        self.cache_bytes = cache_bytes
+        self.checkpoint_dir = checkpoint_dir
+        self.checkpoint_extra = checkpoint_extra
+        # (path, memory map, views of the map) of each spilled size
+        self.spilled: list[tuple[str, mmap.mmap, list[memoryview]]] = []
         self.__setup__()
 
+    def close(self) -> None:
+        """
+        Unmap and remove the spilled files and their directory,
+        memory must not be accessed afterwards.
+        """
+        self.__release_spill__()
+        if self.spill is not None:
+            self.spill.cleanup()
+
     def count_programs_at_size(self, size: int) -> int:
+        if self.compact:
+            return sum(len(self.offsets[state].get(size, ())) for state in self.offsets)
         return sum(len(self.memory[state][size]) for state in self.memory)
 
     def __setup__(self) -> None:
+        self.__release_spill__()
         self.var_types = {
             state
             for state, derivations in self.grammar.reversed_rules.items()
@@ -25,6 +95,16 @@ class Enumerator:
         self.memory: dict[Any, dict[int, list[Program]]] = {}
         for state in self.states:
             self.memory[state] = defaultdict(list)
+        if self.compact:
+            self.rules: list[tuple[Program, tuple[Any, ...]]] = []
+            # State -> Size -> flat records (rule id, child size, child index, ...)
+            self.records: dict[Any, dict[int, array]] = {}
+            # State -> Size -> start of each record
+            self.offsets: dict[Any, dict[int, array]] = {}
+            for state in self.states:
+                self.records[state] = {}
+                self.offsets[state] = {}
+            self.memory = CompactMemory(self)  # type: ignore
         # Memorize (State, State, ...) -> Size -> (Program, Program, ...)
         self.memory_combinations: dict[
             tuple[Any, ...], dict[int, list[tuple[Program, ...]]]
@@ -34,19 +114,34 @@ class Enumerator:
                 _, args = derivation
                 if len(args) > 0 and args not in self.memory_combinations:
                     self.memory_combinations[args] = {}
+        # (State, State, ...), Size -> estimated bytes, least recently used first
+        self.lru: OrderedDict[tuple[tuple[Any, ...], int], int] = OrderedDict()
+        self.cache_used_bytes = 0
+        self.cache_hits = 0
+        self.cache_misses = 0
         self.current_size = 0
+        self.current_depth = 0
 
     def __query_combinations__(
         self, args: tuple[Any, ...], size: int
     ) -> Generator[tuple[Program, ...], None, None]:
         # Use cache if available
         if size in self.memory_combinations[args]:
+            self.cache_hits += 1
+            if self.combination_cache == CombinationCache.LRU:
+                self.lru.move_to_end((args, size))
             for el in self.memory_combinations[args][size]:
                 yield el
         # Iterate over all combinations
         else:
-            mem = []
-            for size_requests in integer_partitions(len(args), size):
+            self.cache_misses += 1
+            mem: list[tuple[Program, ...]] | None = None
+            if self.combination_cache != CombinationCache.NONE:
+                mem = []
+            # Estimated bytes of a list slot and its tuple
+            entry_bytes = 8 + sys.getsizeof(tuple(args))
+            max_entries = self.cache_bytes // entry_bytes
+            for size_requests in integer_partitions_table(len(args), size):
                 possibles = [
                     self.memory[state][sub_size]
                     for state, sub_size in zip(args, size_requests)
@@ -55,13 +150,36 @@ class Enumerator:
                     continue
                 for combination in product(*possibles):
                     yield combination
-                    mem.append(combination)
-            self.memory_combinations[args][size] = mem
+                    if mem is not None:
+                        mem.append(combination)
+                if (
+                    mem is not None
+                    and self.combination_cache == CombinationCache.LRU
+                    and len(mem) > max_entries
+                ):
+                    mem = None
+            if mem is not None:
+                self.memory_combinations[args][size] = mem
+                if self.combination_cache == CombinationCache.LRU:
+                    self.__add_to_lru__(args, size, len(mem) * entry_bytes)
+
+    def __add_to_lru__(self, args: tuple[Any, ...], size: int, nbytes: int) -> None:
+        self.lru[(args, size)] = nbytes
+        self.cache_used_bytes += nbytes
+        while self.cache_used_bytes > self.cache_bytes:
+            (old_args, old_size), old_bytes = self.lru.popitem(last=False)
+            del self.memory_combinations[old_args][old_size]
+            self.cache_used_bytes -= old_bytes
 
     def enumerate_until_size(self, size: int) -> Generator[Program, bool, None]:
         """
         Enumerate all programs until programs reach target size (excluded).
         """
+        if self.current_depth > 0:
+            raise ValueError("enumerator already enumerates by depth")
+        if self.compact:
+            yield from self.__enumerate_compact__(size)
+            return
 
         while self.current_size + 1 < size:
             self.current_size += 1
@@ -95,3 +213,541 @@ class Enumerator:
                                     self.memory[state][self.current_size].append(
                                         program
                                     )
+            self.__size_done__()
+
+    def enumerate_until_depth(self, depth: int) -> Generator[Program, bool, None]:
+        """
+        Enumerate all programs until programs reach target depth (excluded), leaves have depth 1.
+        memory is then State -> Depth -> Programs,
+        programs of depth d combine children of depth at most d - 1 with at least one of depth d - 1.
+        Same protocol as enumerate_until_size.
+        """
+        if self.current_size > 0:
+            raise ValueError("enumerator already enumerates by size")
+        if self.compact:
+            raise ValueError("depth enumeration does not support compact memory")
+        while self.current_depth + 1 < depth:
+            self.current_depth += 1
+            # State -> Programs of depth less than current_depth - 1
+            below = {
+                state: [
+                    program
+                    for d in range(1, self.current_depth - 1)
+                    for program in self.memory[state][d]
+                ]
+                for state in self.states
+            }
+            for state in self.states:
+                for derivation in self.grammar.reversed_rules[state]:
+                    letter, args = derivation
+                    if (len(args) == 0) != (self.current_depth == 1):
+                        continue
+                    for combination in self.__depth_combinations__(
+                        args, self.current_depth - 1, below
+                    ):
+                        program = letter
+                        if len(args) > 0:
+                            program = Function(letter, list(combination))
+                        should_keep = True
+                        if state in self.grammar.finals:
+                            should_keep = yield program
+                        if should_keep:
+                            self.memory[state][self.current_depth].append(program)
+
+    def __depth_combinations__(
+        self, args: tuple[Any, ...], depth: int, below: dict[Any, list[Program]]
+    ) -> Generator[tuple[Program, ...], None, None]:
+        """
+        Combinations of kept programs of args of max depth exactly depth.
+        """
+        if len(args) == 0:
+            yield ()
+            return
+        # The first argument of the given depth is at position i
+        for i, state in enumerate(args):
+            possibles = (
+                [below[s] for s in args[:i]]
+                + [self.memory[state][depth]]
+                + [below[s] + self.memory[s][depth] for s in args[i + 1 :]]
+            )
+            if any(len(x) == 0 for x in possibles):
+                continue
+            yield from product(*possibles)
+
+    def __size_done__(self) -> None:
+        if self.checkpoint_dir is not None:
+            extra = None if self.checkpoint_extra is None else self.checkpoint_extra()
+            self.save_checkpoint(self.checkpoint_dir, extra)
+
+    def __memory_records__(
+        self,
+    ) -> tuple[
+        list[tuple[Program, tuple[Any, ...]]],
+        dict[Any, dict[int, array]],
+        dict[Any, dict[int, array]],
+        dict[Program, tuple[int, int, int]],
+    ]:
+        """
+        Returns rules, records and offsets of memory as in compact mode,
+        and program -> (state index, size, index) of memory (empty in compact mode).
+        """
+        if self.compact:
+            return self.rules, self.records, self.offsets, {}
+        rules: list[tuple[Program, tuple[Any, ...]]] = []
+        rule_ids: dict[tuple[Program, tuple[Any, ...]], int] = {}
+        records: dict[Any, dict[int, array]] = {state: {} for state in self.states}
+        offsets: dict[Any, dict[int, array]] = {state: {} for state in self.states}
+        refs: dict[Program, tuple[int, int, int]] = {}
+        for size in range(1, self.current_size + 1):
+            for state_index, state in enumerate(self.states):
+                programs = self.memory[state].get(size, [])
+                if len(programs) == 0:
+                    continue
+                state_records = array("i")
+                state_offsets = array("i")
+                for index, program in enumerate(programs):
+                    refs[program] = (state_index, size, index)
+                    children: list[Program] = []
+                    letter = program
+                    if isinstance(program, Function):
+                        letter, children = program.function, program.arguments
+                    child_refs = [refs[child] for child in children]
+                    derivation = (
+                        letter,
+                        tuple(self.states[ref[0]] for ref in child_refs),
+                    )
+                    rule_id = rule_ids.get(derivation)
+                    if rule_id is None:
+                        rule_id = len(rules)
+                        rule_ids[derivation] = rule_id
+                        rules.append(derivation)
+                    state_offsets.append(len(state_records))
+                    state_records.append(rule_id)
+                    for _, child_size, child_index in child_refs:
+                        state_records.append(child_size)
+                        state_records.append(child_index)
+                records[state][size] = state_records
+                offsets[state][size] = state_offsets
+        return rules, records, offsets, refs
+
+    def save_checkpoint(self, directory: str, extra: Any = None) -> None:
+        """
+        Save the enumeration state and extra in directory/enumerator.ckpt.
+        Programs are saved as records (rule, (size, index) of each child),
+        programs in extra are saved as references to memory or as strings.
+        Combination caches are not saved.
+        """
+        rules, records, offsets, refs = self.__memory_records__()
+        if self.spill is not None:
+            records, offsets = [
+                {
+                    state: {
+                        size: array("i", layer.tobytes())
+                        for size, layer in by_size.items()
+                    }
+                    for state, by_size in table.items()
+                }
+                for table in (records, offsets)
+            ]
+        extra_fd = io.BytesIO()
+        __ProgramPickler__(extra_fd, refs).dump(extra)
+        data = {
+            "states": self.states,
+            "current_size": self.current_size,
+            "rules": [(str(letter), args) for letter, args in rules],
+            "records": records,
+            "offsets": offsets,
+            "extra": extra_fd.getvalue(),
+        }
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, "enumerator.ckpt")
+        with open(path + ".tmp", "wb") as fd:
+            pickle.dump(data, fd, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(path + ".tmp", path)
+
+    def load_checkpoint(self, directory: str) -> Any:
+        """
+        Restore the enumeration state saved by save_checkpoint and returns its extra,
+        the enumeration continues after the last completed size.
+        """
+        with open(os.path.join(directory, "enumerator.ckpt"), "rb") as fd:
+            data = pickle.load(fd)
+        if data["states"] != self.states:
+            raise ValueError("checkpoint was saved for another grammar")
+        derivations = {
+            (str(letter), args): (letter, args)
+            for state in self.states
+            for letter, args in self.grammar.reversed_rules[state]
+        }
+        try:
+            rules = [derivations[(letter, args)] for letter, args in data["rules"]]
+        except KeyError:
+            raise ValueError("checkpoint was saved for another grammar")
+        self.__setup__()
+        self.current_size = data["current_size"]
+        if self.compact:
+            self.rules = rules
+            self.records = data["records"]
+            self.offsets = data["offsets"]
+            if self.spill is not None:
+                for size in range(1, self.current_size + 1):
+                    self.__spill_size__(size)
+        else:
+            for size in range(1, self.current_size + 1):
+                for state in self.states:
+                    records = data["records"][state].get(size)
+                    if records is None:
+                        continue
+                    programs = self.memory[state][size]
+                    for start in data["offsets"][state][size]:
+                        letter, args = rules[records[start]]
+                        if len(args) == 0:
+                            programs.append(letter)
+                            continue
+                        children = [
+                            self.memory[arg][records[start + 1 + 2 * i]][
+                                records[start + 2 + 2 * i]
+                            ]
+                            for i, arg in enumerate(args)
+                        ]
+                        programs.append(Function(letter, children))
+        return __ProgramUnpickler__(io.BytesIO(data["extra"]), self).load()
+
+    def __spill_size__(self, size: int) -> None:
+        """
+        Write the layers of all states of the given size one after the other
+        (offsets then records of each state) to one file and replace them by views of its memory map.
+        """
+        states = [state for state in self.states if size in self.offsets[state]]
+        if len(states) == 0:
+            return
+        path = os.path.join(self.spill.name, f"{size}.bin")  # type: ignore
+        with open(path, "wb") as fd:
+            for state in states:
+                self.offsets[state][size].tofile(fd)
+                self.records[state][size].tofile(fd)
+        with open(path, "rb") as fd:
+            mapped = mmap.mmap(fd.fileno(), 0, access=mmap.ACCESS_READ)
+        view = memoryview(mapped)
+        ints = view.cast("i")
+        views = [view, ints]
+        start = 0
+        for state in states:
+            for table in (self.offsets, self.records):
+                end = start + len(table[state][size])
+                views.append(ints[start:end])
+                table[state][size] = views[-1]  # type: ignore
+                start = end
+        self.spilled.append((path, mapped, views))
+
+    def __release_spill__(self) -> None:
+        for path, mapped, views in self.spilled:
+            # Views depending on others are released first
+            for view in reversed(views):
+                view.release()
+            mapped.close()
+            os.remove(path)
+        self.spilled = []
+
+    def __enumerate_compact__(self, size: int) -> Generator[Program, bool, None]:
+        rule_ids = {rule: i for i, rule in enumerate(self.rules)}
+        while self.current_size + 1 < size:
+            self.current_size += 1
+            for state in self.states:
+                records = array("i")
+                offsets = array("i")
+                # (state, size) -> materialised programs, shared by the rules of this state
+                layers: (
+                    dict[tuple[Any, int], list[tuple[tuple[int, int], Program]]] | None
+                ) = None
+                if self.spill is None:
+                    layers = {}
+                for derivation in self.grammar.reversed_rules[state]:
+                    letter, args = derivation
+                    if (len(args) == 0) != (self.current_size == 1):
+                        continue
+                    rule_id = rule_ids.get(derivation)
+                    if rule_id is None:
+                        rule_id = len(self.rules)
+                        rule_ids[derivation] = rule_id
+                        self.rules.append(derivation)
+                    for combination in self.__query_compact_combinations__(
+                        args, self.current_size - 1, layers
+                    ):
+                        should_keep = True
+                        if state in self.grammar.finals:
+                            program = letter
+                            if len(args) > 0:
+                                program = Function(
+                                    letter, [child for _, child in combination]
+                                )
+                            should_keep = yield program
+                        if should_keep:
+                            offsets.append(len(records))
+                            records.append(rule_id)
+                            for key, _ in combination:
+                                records.extend(key)
+                if len(offsets) > 0:
+                    self.records[state][self.current_size] = records
+                    self.offsets[state][self.current_size] = offsets
+            if self.spill is not None:
+                self.__spill_size__(self.current_size)
+            self.__size_done__()
+
+    def __query_compact_combinations__(
+        self,
+        args: tuple[Any, ...],
+        size: int,
+        layers: dict[tuple[Any, int], list[tuple[tuple[int, int], Program]]] | None,
+    ) -> Generator[tuple[tuple[tuple[int, int], Program], ...], None, None]:
+        """
+        Combinations of ((size, index), program) of kept programs of args,
+        programs are materialised in layers which are dropped once the state is done.
+        If layers is None, only the programs of the current combination are materialised.
+        """
+        if len(args) == 0:
+            yield ()
+            return
+        for size_requests in integer_partitions_table(len(args), size):
+            if any(
+                sub_size not in self.offsets[state]
+                for state, sub_size in zip(args, size_requests)
+            ):
+                continue
+            if layers is None:
+                yield from self.__lazy_combinations__(args, size_requests)
+                continue
+            possibles = []
+            for state, sub_size in zip(args, size_requests):
+                key = (state, sub_size)
+                if key not in layers:
+                    layers[key] = [
+                        ((sub_size, i), program)
+                        for i, program in enumerate(self.memory[state][sub_size])
+                    ]
+                possibles.append(layers[key])
+            yield from product(*possibles)
+
+    def __lazy_combinations__(
+        self, args: tuple[Any, ...], size_requests: tuple[int, ...]
+    ) -> Generator[tuple[tuple[tuple[int, int], Program], ...], None, None]:
+        parts = list(zip(args, size_requests))
+        current: list[Any] = [None] * len(parts)
+        last = [-1] * len(parts)
+        for indices in product(
+            *[range(len(self.offsets[state][sub_size])) for state, sub_size in parts]
+        ):
+            # Earlier parts change less often
+            for j, index in enumerate(indices):
+                if index != last[j]:
+                    state, sub_size = parts[j]
+                    current[j] = (
+                        (sub_size, index),
+                        self.program_at(state, sub_size, index),
+                    )
+                    last[j] = index
+            yield tuple(current)
+
+    def __materialise__(
+        self,
+        letter: Program,
+        args: tuple[Any, ...],
+        combination: tuple[tuple[int, int], ...],
+    ) -> Program:
+        if len(args) == 0:
+            return letter
+        return Function(
+            letter,
+            [
+                self.program_at(state, size, index)
+                for state, (size, index) in zip(args, combination)
+            ],
+        )
+
+    def program_at(self, state: Any, size: int, index: int) -> Program:
+        """
+        Compact mode only: materialise the index-th kept program of the given state and size.
+        """
+        records = self.records[state][size]
+        start = self.offsets[state][size][index]
+        letter, args = self.rules[records[start]]
+        combination = tuple(
+            (records[start + 1 + 2 * i], records[start + 2 + 2 * i])
+            for i in range(len(args))
+        )
+        return self.__materialise__(letter, args, combination)
+
+
+class __ProgramPickler__(pickle.Pickler):
+    """
+    Programs are saved by reference to the memory of the enumerator or by string,
+    since hashes of programs depend on the process.
+    """
+
+    def __init__(self, fd: io.BytesIO, refs: dict[Program, tuple[int, int, int]]):
+        super().__init__(fd, protocol=pickle.HIGHEST_PROTOCOL)
+        self.refs = refs
+
+    def persistent_id(self, obj: Any) -> Any:
+        if isinstance(obj, Program):
+            ref = self.refs.get(obj)
+            if ref is not None:
+                return ref
+            return str(obj)
+        return None
+
+
+class __ProgramUnpickler__(pickle.Unpickler):
+    def __init__(self, fd: io.BytesIO, enumerator: Enumerator):
+        super().__init__(fd)
+        self.enumerator = enumerator
+
+    def persistent_load(self, pid: Any) -> Any:
+        if isinstance(pid, str):
+            return str_to_program(pid)
+        state_index, size, index = pid
+        return self.enumerator.memory[self.enumerator.states[state_index]][size][index]
+
+
+class CompactMemory:
+    """
+    Read only view State -> Size -> Programs of the memory of a compact Enumerator,
+    programs are materialised on access.
+    """
+
+    def __init__(self, enumerator: Enumerator):
+        self.enumerator = enumerator
+
+    def __getitem__(self, state: Any) -> "CompactStateMemory":
+        return CompactStateMemory(self.enumerator, state)
+
+    def __iter__(self) -> Iterator[Any]:
+        return iter(self.enumerator.states)
+
+    def __len__(self) -> int:
+        return len(self.enumerator.states)
+
+    def __contains__(self, state: Any) -> bool:
+        return state in self.enumerator.offsets
+
+    def keys(self) -> list[Any]:
+        return list(self.enumerator.states)
+
+
+class CompactStateMemory:
+    """
+    Read only view Size -> Programs of a state, missing sizes have no programs.
+    """
+
+    def __init__(self, enumerator: Enumerator, state: Any):
+        self.enumerator = enumerator
+        self.state = state
+
+    def __getitem__(self, size: int) -> list[Program]:
+        count = len(self.enumerator.offsets[self.state].get(size, ()))
+        return [self.enumerator.program_at(self.state, size, i) for i in range(count)]
+
+    def keys(self) -> list[int]:
+        return list(range(1, self.enumerator.current_size + 1))
+
+
+class WeightedEnumerator:
+    """
+    Enumerate programs by non-decreasing cost, the cost of a program is the sum of the costs of its rules.
+    Costs must be strictly positive, otherwise a cycle of rules costing nothing
+    would produce infinitely many programs of the same cost.
+
+    Each rule has a frontier of vectors of indices in the lists of kept programs of its arguments,
+    kept programs of a state are sorted by cost so the successors of a vector
+    (one index incremented) cost at least as much as the vector.
+    A vector that points past the end of a list waits until a program is kept there.
+    """
+
+    def __init__(
+        self,
+        grammar: DFTA[Any, Program],
+        cost: Callable[[Program, tuple[Any, ...]], float],
+    ):
+        self.grammar = grammar
+        self.states = sorted(self.grammar.states)
+        # Rules consuming an unreachable state never produce a program
+        reachable = self.grammar.states
+        self.rules: list[tuple[Program, tuple[Any, ...], Any, float]] = [
+            (letter, args, dst, cost(letter, args))
+            for (letter, args), dst in self.grammar.rules.items()
+            if all(arg in reachable for arg in args)
+        ]
+        for letter, args, _, rule_cost in self.rules:
+            if not rule_cost > 0:
+                raise ValueError(
+                    f"costs must be strictly positive: {letter} {args} costs {rule_cost}"
+                )
+        self.__setup__()
+
+    def count_programs_at_size(self, size: int) -> int:
+        return sum(len(self.memory[state][size]) for state in self.memory)
+
+    def __setup__(self) -> None:
+        # Memorize State -> Size -> Programs
+        self.memory: dict[Any, dict[int, list[Program]]] = {}
+        # Memorize State -> kept (cost, size, program) sorted by cost
+        self.ordered: dict[Any, list[tuple[float, int, Program]]] = {}
+        for state in self.states:
+            self.memory[state] = defaultdict(list)
+            self.ordered[state] = []
+        # (cost, tie breaker, rule index, vector)
+        self.heap: list[tuple[float, int, int, tuple[int, ...]]] = []
+        self.order = count()
+        self.seen: set[tuple[int, tuple[int, ...]]] = set()
+        # (state, index) -> (rule index, vector) waiting for the index-th program of state
+        self.waiting: dict[tuple[Any, int], list[tuple[int, tuple[int, ...]]]] = (
+            defaultdict(list)
+        )
+        for rule_index, (_, args, __, ___) in enumerate(self.rules):
+            self.__push__(rule_index, tuple(0 for _ in args))
+        self.current_cost = 0.0
+
+    def __push__(self, rule_index: int, vector: tuple[int, ...]) -> None:
+        key = (rule_index, vector)
+        if key in self.seen:
+            return
+        _, args, __, cost = self.rules[rule_index]
+        for state, i in zip(args, vector):
+            if i >= len(self.ordered[state]):
+                self.waiting[(state, i)].append(key)
+                return
+            cost += self.ordered[state][i][0]
+        self.seen.add(key)
+        heappush(self.heap, (cost, next(self.order), rule_index, vector))
+
+    def __keep__(self, state: Any, cost: float, size: int, program: Program) -> None:
+        self.memory[state][size].append(program)
+        self.ordered[state].append((cost, size, program))
+        for key in self.waiting.pop((state, len(self.ordered[state]) - 1), []):
+            self.__push__(*key)
+
+    def enumerate_until_cost(self, cost: float) -> Generator[Program, bool, None]:
+        """
+        Enumerate all programs by non-decreasing cost until programs reach target cost (excluded).
+        Same protocol as Enumerator.enumerate_until_size: sending False discards the last program yielded,
+        programs of non final states are always kept.
+        """
+        while self.heap and self.heap[0][0] < cost:
+            program_cost, _, rule_index, vector = heappop(self.heap)
+            self.current_cost = program_cost
+            letter, args, dst, __ = self.rules[rule_index]
+            if len(args) == 0:
+                program, size = letter, 1
+            else:
+                children = [self.ordered[state][i] for state, i in zip(args, vector)]
+                program = Function(letter, [child[2] for child in children])
+                size = 1 + sum(child[1] for child in children)
+            should_keep = True
+            if dst in self.grammar.finals:
+                should_keep = yield program
+            if should_keep:
+                self.__keep__(dst, program_cost, size, program)
+            for k in range(len(vector)):
+                self.__push__(
+                    rule_index, vector[:k] + (vector[k] + 1,) + vector[k + 1 :]
+                )
@@ -13,7 +13,19 @@ def random_product(
         yield tuple(prng.choice(li) for li in elements)
 
 
+# Output of a program on an input where a skipped exception was raised
+__FAILED__ = object()
+
+
 class Evaluator:
+    """
+    If columnar is True, the outputs of a program on all inputs of a type request
+    are computed at once from the output columns of its arguments,
+    with the vectorised semantic of the primitive if the DSL has one and no argument failed,
+    otherwise with the semantic on each input.
+    memoization is then Program -> type request -> column of outputs.
+    """
+
     def __init__(
         self,
         dsl: DSL,
@@ -21,8 +33,10 @@ class Evaluator:
         equal_dict: dict[str, Callable],
         skip_exceptions: set,
         seed: int = 1,
+        columnar: bool = False,
     ):
         self.dsl = dsl
+        self.columnar = columnar
         self.equiv_classes: dict[str, dict[Any, Program]] = defaultdict(dict)
         self.memoization: dict[Program, dict[Any, Any]] = defaultdict(dict)
         self.rtypes: dict[str, str] = {
@@ -75,15 +89,21 @@ class Evaluator:
         self.__gen_full_inputs__(type_req)
         # Compute its values
         outs = []
-        for full_input in self.full_inputs[type_req]:
-            try:
-                out = self.__eval__(program, full_input)
-            except Exception as e:
-                if any(isinstance(e, cls) for cls in self.skip_exceptions):
-                    out = None
-                else:
-                    raise e
-            outs.append(out)
+        if self.columnar:
+            outs = [
+                None if out is __FAILED__ else out
+                for out in self.__column__(program, type_req)
+            ]
+        else:
+            for full_input in self.full_inputs[type_req]:
+                try:
+                    out = self.__eval__(program, full_input)
+                except Exception as e:
+                    if any(isinstance(e, cls) for cls in self.skip_exceptions):
+                        out = None
+                    else:
+                        raise e
+                outs.append(out)
         # Check equivalence class
         rtype = self.__return_type__(program, type_req)
         key = tuple(outs)
@@ -112,3 +132,49 @@ class Evaluator:
 
         mem[full_input] = out
         return out
+
+    def __column__(self, program: Program, type_req: str) -> list:
+        mem = self.memoization[program]
+        if type_req in mem:
+            return mem[type_req]
+        full_inputs = self.full_inputs[type_req]
+        column: list = []
+        match program:
+            case Variable(no):
+                column = [full_input[no] for full_input in full_inputs]
+            case Primitive(name):
+                column = [self.dsl.semantic(name)] * len(full_inputs)
+            case Function(Primitive(name), arguments):
+                arg_columns = [self.__column__(arg, type_req) for arg in arguments]
+                column = self.__apply__(name, arg_columns)
+            case _:
+                raise ValueError
+        mem[type_req] = column
+        return column
+
+    def __apply__(self, name: str, arg_columns: list[list]) -> list:
+        vectorized = self.dsl.vectorized_semantic(name)
+        if vectorized is not None and not any(
+            out is __FAILED__ for column in arg_columns for out in column
+        ):
+            try:
+                column = vectorized(*arg_columns)
+                return column.tolist() if hasattr(column, "tolist") else list(column)
+            except Exception as e:
+                if not any(isinstance(e, cls) for cls in self.skip_exceptions):
+                    raise e
+                # Find failing inputs with the semantic
+        fun = self.dsl.semantic(name)
+        column = []
+        for arg_vals in zip(*arg_columns):
+            if any(val is __FAILED__ for val in arg_vals):
+                column.append(__FAILED__)
+                continue
+            try:
+                column.append(fun(*arg_vals))
+            except Exception as e:
+                if any(isinstance(e, cls) for cls in self.skip_exceptions):
+                    column.append(__FAILED__)
+                else:
+                    raise e
+        return column
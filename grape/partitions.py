@@ -1,3 +1,4 @@
+from functools import lru_cache
 from typing import Generator, Tuple
 
 
@@ -17,3 +18,11 @@ def integer_partitions(k: int, n: int) -> Generator[Tuple[int, ...], None, None]
         tup[i] -= 1
         tup[i + 1] += 1 + carry
         yield tuple(tup)
+
+
+@lru_cache(maxsize=None)
+def integer_partitions_table(k: int, n: int) -> Tuple[Tuple[int, ...], ...]:
+    """
+    Cached version of integer_partitions.
+    """
+    return tuple(integer_partitions(k, n))
@@ -66,6 +66,18 @@ class Function(Program):
         return self.function.size() + sum(arg.size() for arg in self.arguments)
 
 
+def letter_to_program(letter: object) -> "Program":
+    """
+    Program of a leaf of an automaton, letters that are not programs are matched by name.
+    """
+    if isinstance(letter, Program):
+        return letter
+    name = str(letter)
+    if name.startswith("var") and name[len("var") :].isdigit():
+        return Variable(int(name[len("var") :]))
+    return Primitive(name)
+
+
 def str_to_program(program: str) -> "Program":
     if "(" == program[0]:
         program = program.strip("() ")
@@ -0,0 +1,171 @@
+from array import array
+import struct
+import sys
+from typing import TYPE_CHECKING, BinaryIO, Dict, Generator, Iterable, List, Tuple
+
+from grape.automaton.automaton_manager import __ints_to_bytes__, __names_to_bytes__
+from grape.automaton.compact_automaton import ID_TYPECODE
+from grape.program import Function, Program, letter_to_program
+
+if TYPE_CHECKING:
+    from grape.automaton.tree_automaton import DFTA
+
+# Stream of programs:
+#   magic, number of letters, arity of each letter, names of letters (as in .grapeb files)
+#   then for each program: number of nodes, opcodes of nodes in prefix order
+# all integers are 32 bits little endian
+PROGRAMB_MAGIC = b"GRAPEP01"
+
+
+class ProgramEncoder:
+    """
+    Opcode of a node: index of (name, arity) in sorted letters.
+    """
+
+    def __init__(self, letters: Iterable[Tuple[str, int]]) -> None:
+        self.letters: List[Tuple[str, int]] = sorted(set(letters))
+        self.opcodes = {letter: i for i, letter in enumerate(self.letters)}
+
+    @staticmethod
+    def from_dfta(dfta: "DFTA") -> "ProgramEncoder":
+        return ProgramEncoder((str(letter), len(args)) for letter, args in dfta.rules)
+
+    def header(self) -> bytes:
+        return (
+            PROGRAMB_MAGIC
+            + struct.pack("<I", len(self.letters))
+            + __ints_to_bytes__([arity for _, arity in self.letters])
+            + __names_to_bytes__([name for name, _ in self.letters])
+        )
+
+    def encode(
+        self, program: Program, out: array, cache: Dict[Program, array] | None = None
+    ) -> None:
+        """
+        Append the number of nodes then the opcodes of program to out.
+        cache: subprogram -> opcodes, shared between programs encoded together.
+        """
+        if cache is None:
+            cache = {}
+        start = len(out)
+        out.append(0)
+        if isinstance(program, Function):
+            out.append(self.opcodes[(str(program.function), len(program.arguments))])
+            for arg in program.arguments:
+                out.extend(self.__opcodes__(arg, cache))
+        else:
+            out.append(self.opcodes[(str(program), 0)])
+        out[start] = len(out) - start - 1
+
+    def __opcodes__(self, program: Program, cache: Dict[Program, array]) -> array:
+        out = cache.get(program)
+        if out is None:
+            if isinstance(program, Function):
+                out = array(
+                    ID_TYPECODE,
+                    [self.opcodes[(str(program.function), len(program.arguments))]],
+                )
+                for arg in program.arguments:
+                    out.extend(self.__opcodes__(arg, cache))
+            else:
+                out = array(ID_TYPECODE, [self.opcodes[(str(program), 0)]])
+            cache[program] = out
+        return out
+
+    def encode_many(self, programs: Iterable[Program]) -> bytes:
+        out = array(ID_TYPECODE)
+        cache: Dict[Program, array] = {}
+        for program in programs:
+            self.encode(program, out, cache)
+        if sys.byteorder != "little":
+            out.byteswap()
+        return out.tobytes()
+
+
+def __read_exactly__(fd: BinaryIO, n: int) -> bytes:
+    data = b""
+    while len(data) < n:
+        part = fd.read(n - len(data))
+        if not part:
+            raise ValueError("invalid program stream: truncated header")
+        data += part
+    return data
+
+
+def __read_ints__(fd: BinaryIO, n: int) -> array:
+    out = array(ID_TYPECODE)
+    out.frombytes(__read_exactly__(fd, 4 * n))
+    if sys.byteorder != "little":
+        out.byteswap()
+    return out
+
+
+def read_header(fd: BinaryIO) -> List[Tuple[str, int]]:
+    """
+    Returns the letters (name, arity) of the stream, indexed by opcode.
+    """
+    if __read_exactly__(fd, len(PROGRAMB_MAGIC)) != PROGRAMB_MAGIC:
+        raise ValueError("invalid program stream: not a binary program stream")
+    (n,) = struct.unpack("<I", __read_exactly__(fd, 4))
+    arities = __read_ints__(fd, n)
+    lengths = __read_ints__(fd, n)
+    names = [str(__read_exactly__(fd, length), "utf-8") for length in lengths]
+    __read_exactly__(fd, -sum(lengths) % 4)
+    return list(zip(names, arities))
+
+
+def read_opcodes(
+    fd: BinaryIO, chunk_size: int = 1 << 20
+) -> Generator[array, None, None]:
+    """
+    Stream the opcodes of each program, the header must have been read.
+    """
+    pending = b""
+    ints = array(ID_TYPECODE)
+    while True:
+        data = fd.read(chunk_size)
+        if not data:
+            break
+        pending += data
+        usable = len(pending) - len(pending) % 4
+        chunk = array(ID_TYPECODE)
+        chunk.frombytes(pending[:usable])
+        if sys.byteorder != "little":
+            chunk.byteswap()
+        pending = pending[usable:]
+        ints.extend(chunk)
+        pos = 0
+        while pos < len(ints) and pos + 1 + ints[pos] <= len(ints):
+            end = pos + 1 + ints[pos]
+            yield ints[pos + 1 : end]
+            pos = end
+        del ints[:pos]
+    if len(ints) > 0 or len(pending) > 0:
+        raise ValueError("invalid program stream: truncated program")
+
+
+def decode(letters: List[Tuple[Program, int]], opcodes: array) -> Program:
+    """
+    Program of opcodes in prefix order, letters: opcode -> (letter, arity).
+    """
+    stack: List[Program] = []
+    for opcode in reversed(opcodes):
+        letter, arity = letters[opcode]
+        if arity == 0:
+            stack.append(letter)
+        else:
+            # The first argument is on top
+            children = stack[-arity:]
+            children.reverse()
+            del stack[-arity:]
+            stack.append(Function(letter, children))
+    return stack[0]
+
+
+def read_programs(fd: BinaryIO) -> Generator[Program, None, None]:
+    """
+    Stream the programs of a binary program stream.
+    """
+    letters = [(letter_to_program(name), arity) for name, arity in read_header(fd)]
+    for opcodes in read_opcodes(fd):
+        yield decode(letters, opcodes)
@@ -1,5 +1,6 @@
 from collections import defaultdict
 import math
+import os
 from typing import Any, Callable
 from grape.automaton.spec_manager import (
     despecialize,
@@ -8,7 +9,7 @@ from grape.automaton.spec_manager import (
     type_request_from_specialized,
 )
 from grape.dsl import DSL
-from grape.enumerator import Enumerator
+from grape.enumerator import CombinationCache, Enumerator
 from grape.evaluator import Evaluator
 from grape.program import Primitive, Program, Variable
 from grape.automaton_generator import (
@@ -100,9 +101,20 @@ def prune(
     max_size: int,
     rtype: str | None = None,
     base_grammar: DFTA | None = None,
+    compact_memory: bool = False,
+    combination_cache: CombinationCache = CombinationCache.ALL,
+    cache_bytes: int = 2**30,
+    checkpoint_dir: str | None = None,
+    resume: bool = False,
+    spill_dir: str | None = None,
 ) -> DFTA[str, Program]:
     """
     Returns specialized grammar
+    compact_memory: kept programs are stored compactly by the enumerator, see Enumerator
+    combination_cache, cache_bytes: policy of the cache of combinations, see Enumerator
+    checkpoint_dir: the enumerator, evaluator and manager are saved there at each completed size
+    resume: continue from the checkpoint in checkpoint_dir if there is one
+    spill_dir: kept programs are spilled to memory-mapped files in this directory, see Enumerator
     """
     # Find all type requests
     type_req = __infer_mega_type_req__(
@@ -121,7 +133,34 @@ def prune(
     enum_ntrees = grammar.trees_until_size(max_size)
     base_ntrees = sum(base_expected_trees.values())
 
-    enumerator = Enumerator(grammar)
+    def checkpoint_extra() -> dict:
+        return {
+            "equiv_classes": dict(evaluator.equiv_classes),
+            "full_inputs": evaluator.full_inputs,
+            "prng": evaluator.prng.getstate(),
+            "classes": manager.classes,
+        }
+
+    enumerator = Enumerator(
+        grammar,
+        compact_memory,
+        combination_cache,
+        cache_bytes,
+        checkpoint_dir,
+        checkpoint_extra,
+        spill_dir,
+    )
+    if (
+        resume
+        and checkpoint_dir is not None
+        and os.path.exists(os.path.join(checkpoint_dir, "enumerator.ckpt"))
+    ):
+        extra = enumerator.load_checkpoint(checkpoint_dir)
+        evaluator.equiv_classes = defaultdict(dict, extra["equiv_classes"])
+        evaluator.full_inputs = extra["full_inputs"]
+        evaluator.prng.setstate(extra["prng"])
+        manager.classes = extra["classes"]
+        print(f"resuming after size {enumerator.current_size}")
 
     expected_trees = grammar.trees_by_size(max_size)
     max_arity = dsl.max_arity()
@@ -144,17 +183,19 @@ def prune(
         return total, ratio
 
     # Generate all programs until some size
-    pbar = tqdm(total=enum_ntrees)
+    # Programs of the sizes completed before resuming are already done
+    done = sum(
+        enumerator.count_programs_at_size(s)
+        for s in range(1, enumerator.current_size + 1)
+    )
+    pbar = tqdm(total=enum_ntrees, initial=done)
     pbar.set_description_str("obs. equiv.")
     gen = enumerator.enumerate_until_size(max_size + 1)
-    program = next(gen)
-    evaluator.eval(program, type_req)
-    should_keep = True
-    last_size = 1
+    last_size = enumerator.current_size + 1
+    n = 0
     try:
-        n = 0
+        program = next(gen)
         while True:
-            program = gen.send(should_keep)
             representative = evaluator.eval(program, type_req)
             should_keep = representative is None
             if not should_keep:
@@ -167,13 +208,19 @@ def prune(
                     pbar.set_postfix_str(f"est. ratio unique programs:{ratio:.0%}")
                     last_size += 1
                 n = 0
+            program = gen.send(should_keep)
     except StopIteration:
         pass
     pbar.update(n)
     pbar.close()
+    if not enumerator.compact:
+        print(
+            f"combination cache: {enumerator.cache_hits} hits, {enumerator.cache_misses} misses"
+        )
     evaluator.free_memory()
     grammar.finals = old_finals
     reduced_grammar, t = grammar_from_memory(enumerator.memory, type_req, old_finals)
+    enumerator.close()
     t = reduced_grammar.trees_until_size(max_size)
     print(f"at size {max_size} programs (after graping): {t:.2e}")
     print(
@@ -0,0 +1,269 @@
+import random
+from collections import defaultdict
+from typing import (
+    TYPE_CHECKING,
+    Dict,
+    Generator,
+    Generic,
+    List,
+    Optional,
+    Tuple,
+    TypeVar,
+)
+
+from grape.automaton.tree_counter import TreeCounter
+from grape.program import Function, Program, letter_to_program
+
+if TYPE_CHECKING:
+    from grape.automaton.tree_automaton import DFTA
+
+U = TypeVar("U")
+V = TypeVar("V")
+
+
+class Sampler(Generic[U, V]):
+    """
+    Exactly uniform sampling of programs of a given size accepted by a DFTA.
+
+    A program is drawn by choosing a uniform index among all programs of that size,
+    the index is then decoded by recursive descent over the count tables of the tree counter:
+        - programs of a state are ordered by argument tuple, then letter, then tuple of subprograms
+        - tuples of subprograms are ordered by size of the last subprogram,
+          then by index of the prefix tuple, then by index of the last subprogram
+    """
+
+    def __init__(
+        self, dfta: "DFTA[U, V]", seed: Optional[int] = None, finals_only: bool = True
+    ) -> None:
+        self.counter: TreeCounter[U] = dfta.counter()
+        self.rng = random.Random(seed)
+        self.roots: List[U] = sorted(
+            dfta.finals if finals_only else dfta.states, key=str
+        )
+        # state -> argument tuple -> letters
+        self.letters: Dict[U, Dict[Tuple[U, ...], List[V]]] = defaultdict(
+            lambda: defaultdict(list)
+        )
+        for (P, args), dst in dfta.rules.items():
+            self.letters[dst][args].append(P)
+        # (state, size) -> all programs in index order, only filled by programs
+        self.memory: Dict[Tuple[U, int], List[Program]] = {}
+
+    def count(self, size: int) -> int:
+        """
+        Number of programs of the given size.
+        """
+        return sum(self.counter.count(q, size) for q in self.roots)
+
+    def sample(self, size: int, n: int = 1) -> List[Program]:
+        """
+        Draw n programs of the given size uniformly and independently.
+        """
+        total = self.count(size)
+        if total == 0:
+            raise ValueError(f"no program of size {size}")
+        return [self.unrank(size, self.rng.randrange(total)) for _ in range(n)]
+
+    def unrank(self, size: int, rank: int) -> Program:
+        """
+        Returns the program of the given size with the given index in [0, count(size)).
+        """
+        if rank >= 0:
+            for q in self.roots:
+                count = self.counter.count(q, size)
+                if rank < count:
+                    return self.__unrank_state__(q, size, rank)
+                rank -= count
+        raise IndexError(f"no program of size {size} with this index")
+
+    def programs(
+        self, size: int, start: int = 0, end: Optional[int] = None
+    ) -> Generator[Program, None, None]:
+        """
+        Enumerate programs of the given size with index in [start, end) in index order,
+        same as unrank on each index but subprograms of smaller sizes are memorised.
+        """
+        end = self.count(size) if end is None else end
+        offset = 0
+        for q in self.roots:
+            count = self.counter.count(q, size)
+            lo, hi = max(start - offset, 0), min(end - offset, count)
+            if lo < hi:
+                yield from self.__programs_state__(q, size, lo, hi)
+            offset += count
+
+    def __all_programs__(self, state: U, size: int) -> List[Program]:
+        key = (state, size)
+        out = self.memory.get(key)
+        if out is None:
+            count = self.counter.count(state, size)
+            out = list(self.__programs_state__(state, size, 0, count))
+            self.memory[key] = out
+        return out
+
+    def __programs_state__(
+        self, state: U, size: int, start: int, end: int
+    ) -> Generator[Program, None, None]:
+        offset = 0
+        for args, letters in self.letters[state].items():
+            tuple_count = self.__tuple_count__(args, size)
+            block = len(letters) * tuple_count
+            lo, hi = max(start - offset, 0), min(end - offset, block)
+            offset += block
+            if lo >= hi:
+                continue
+            if len(args) == 0:
+                for i in range(lo, hi):
+                    yield letter_to_program(letters[i])
+                continue
+            for i in range(lo // tuple_count, (hi - 1) // tuple_count + 1):
+                letter = letter_to_program(letters[i])
+                base = i * tuple_count
+                for children in self.__tuples__(
+                    args,
+                    size - 1,
+                    max(lo - base, 0),
+                    min(hi - base, tuple_count),
+                ):
+                    yield Function(letter, children)
+
+    def __tuples__(
+        self, args: Tuple[U, ...], size: int, start: int, end: int
+    ) -> Generator[List[Program], None, None]:
+        if len(args) == 1:
+            for program in self.__all_programs__(args[0], size)[start:end]:
+                yield [program]
+            return
+        prefix = args[:-1]
+        prefix_counts = self.counter.tuple_counts(prefix)
+        last_counts = self.counter.counts[args[-1]]
+        offset = 0
+        for x in range(1, size - len(prefix) + 1):
+            count = last_counts[x]
+            block = prefix_counts[size - x] * count
+            lo, hi = max(start - offset, 0), min(end - offset, block)
+            offset += block
+            if lo >= hi:
+                continue
+            lasts = self.__all_programs__(args[-1], x)
+            prefix_rank = lo // count
+            for children in self.__tuples__(
+                prefix, size - x, prefix_rank, (hi - 1) // count + 1
+            ):
+                base = prefix_rank * count
+                for last in lasts[max(lo - base, 0) : min(hi - base, count)]:
+                    yield children + [last]
+                prefix_rank += 1
+
+    def __tuple_count__(self, args: Tuple[U, ...], size: int) -> int:
+        """
+        Number of tuples of subprograms for a program of the given size.
+        """
+        if len(args) == 0:
+            return 1 if size == 1 else 0
+        elif len(args) <= size - 1:
+            return self.counter.tuple_counts(args)[size - 1]
+        return 0
+
+    def rank(self, program: Program, states: Dict[Program, Optional[U]]) -> int:
+        """
+        Returns the index of the given program among programs of its size, inverse of unrank.
+        states: subprogram -> reached state, see DFTA.run.
+        """
+        size = program.size()
+        # Count tables of all states are read below, not only those of the roots before state
+        self.counter.extend(size)
+        state = states[program]
+        rank = 0
+        for q in self.roots:
+            if q == state:
+                return rank + self.__rank_state__(q, program, size, states)
+            rank += self.counter.count(q, size)
+        raise ValueError(f"program is not accepted: {program}")
+
+    def __rank_state__(
+        self,
+        state: U,
+        program: Program,
+        size: int,
+        states: Dict[Program, Optional[U]],
+    ) -> int:
+        if isinstance(program, Function):
+            name = str(program.function)
+            children = program.arguments
+        else:
+            name = str(program)
+            children = []
+        child_states: List[U] = []
+        for child in children:
+            child_state = states[child]
+            if child_state is None:
+                raise ValueError(f"program is not accepted: {program}")
+            child_states.append(child_state)
+        args = tuple(child_states)
+        rank = 0
+        for other, letters in self.letters[state].items():
+            tuple_count = self.__tuple_count__(other, size)
+            if other == args:
+                index = [str(letter) for letter in letters].index(name)
+                rank += index * tuple_count
+                if len(args) > 0:
+                    rank += self.__rank_tuple__(args, children, size - 1, states)
+                return rank
+            rank += len(letters) * tuple_count
+        raise ValueError(f"program is not accepted: {program}")
+
+    def __rank_tuple__(
+        self,
+        args: Tuple[U, ...],
+        children: List[Program],
+        size: int,
+        states: Dict[Program, Optional[U]],
+    ) -> int:
+        if len(args) == 1:
+            return self.__rank_state__(args[0], children[0], size, states)
+        prefix = args[:-1]
+        prefix_counts = self.counter.tuple_counts(prefix)
+        last_counts = self.counter.counts[args[-1]]
+        last_size = children[-1].size()
+        rank = 0
+        for x in range(1, last_size):
+            rank += prefix_counts[size - x] * last_counts[x]
+        prefix_rank = self.__rank_tuple__(
+            prefix, children[:-1], size - last_size, states
+        )
+        last_rank = self.__rank_state__(args[-1], children[-1], last_size, states)
+        return rank + prefix_rank * last_counts[last_size] + last_rank
+
+    def __unrank_state__(self, state: U, size: int, rank: int) -> Program:
+        for args, letters in self.letters[state].items():
+            tuple_count = self.__tuple_count__(args, size)
+            block = len(letters) * tuple_count
+            if rank < block:
+                letter = letter_to_program(letters[rank // tuple_count])
+                if len(args) == 0:
+                    return letter
+                return Function(
+                    letter,
+                    self.__unrank_tuple__(args, size - 1, rank % tuple_count),
+                )
+            rank -= block
+        raise IndexError(f"no program of size {size} with this index")
+
+    def __unrank_tuple__(
+        self, args: Tuple[U, ...], size: int, rank: int
+    ) -> List[Program]:
+        if len(args) == 1:
+            return [self.__unrank_state__(args[0], size, rank)]
+        prefix = args[:-1]
+        prefix_counts = self.counter.tuple_counts(prefix)
+        last_counts = self.counter.counts[args[-1]]
+        for x in range(1, size - len(prefix) + 1):
+            block = prefix_counts[size - x] * last_counts[x]
+            if rank < block:
+                prefix_rank, last_rank = divmod(rank, last_counts[x])
+                return self.__unrank_tuple__(prefix, size - x, prefix_rank) + [
+                    self.__unrank_state__(args[-1], x, last_rank)
+                ]
+            rank -= block
+        raise IndexError(f"no tuple of size {size} with this index")
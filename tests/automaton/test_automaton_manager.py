@@ -0,0 +1,97 @@
+import io
+
+from grape.automaton.automaton_manager import (
+    AutomatonFormat,
+    dump_automaton_to_binary,
+    dump_automaton_to_file,
+    dump_automaton_to_str,
+    load_automaton_from_binary,
+    load_automaton_from_file,
+    read_automaton,
+    write_automaton,
+)
+from grape.automaton_generator import grammar_by_saturation, size_constraint
+from grape.dsl import DSL
+
+
+dsl = DSL(
+    {
+        "1": ("int", 1),
+        "0": ("int", 0),
+        "+": ("int -> int -> int", lambda x, y: x + y),
+        "-": ("int -> int", lambda x: -x),
+    }
+)
+
+grammar = grammar_by_saturation(
+    dsl, "int->int", [size_constraint(0, 5)]
+).classic_state_renaming()
+
+
+def test_binary_round_trip():
+    fd = io.BytesIO()
+    dump_automaton_to_binary(grammar, fd)
+    loaded = load_automaton_from_binary(fd.getvalue())
+    assert loaded.rules == grammar.map_alphabet(str).rules
+    assert loaded.finals == grammar.finals
+
+
+def test_binary_file_matches_text(tmp_path):
+    dump_automaton_to_file(grammar, str(tmp_path / "grammar.grape"))
+    dump_automaton_to_file(grammar, str(tmp_path / "grammar.grapeb"))
+    text = load_automaton_from_file(str(tmp_path / "grammar.grape"))
+    binary = load_automaton_from_file(str(tmp_path / "grammar.grapeb"))
+    assert binary.rules == text.rules
+    assert binary.finals == text.finals
+
+
+def test_compressed_files(tmp_path):
+    for extension in [".grape", ".ebnf", ".lark", ".grapeb"]:
+        plain = str(tmp_path / f"grammar{extension}")
+        dump_automaton_to_file(grammar, plain)
+        expected = load_automaton_from_file(plain)
+        for compression in [".gz", ".xz"]:
+            dump_automaton_to_file(grammar, plain + compression)
+            loaded = load_automaton_from_file(plain + compression)
+            assert loaded.rules == expected.rules
+            assert loaded.finals == expected.finals
+
+
+small = grammar_by_saturation(
+    DSL(
+        {
+            "1": ("int", 1),
+            "-": ("int -> int", lambda x: -x),
+            "+": ("int -> int -> int", lambda x, y: x + y),
+        }
+    ),
+    "int->int",
+    [size_constraint(0, 3)],
+).classic_state_renaming()
+
+# Output of the serialiser before it was made streaming
+expected_dumps = {
+    AutomatonFormat.GRAPE: "finals:S0,S1,S2\nletters:+,-,1,var0\nstates:S0,S1,S2\n"
+    + "S0,1\nS0,var0\nS1,+,S0,S0\nS1,-,S2\nS2,-,S0",
+    AutomatonFormat.EBNF: 'S1 = "+" , S0, S0 | "-" , S2;\nS2 = "-" , S0;\n'
+    + 'S0 = "1" | "var0";',
+    AutomatonFormat.LARK: 'S1 : "+" S0 S0 | "-" S2\nS2 : "-" S0\nS0 : "1" | "var0"',
+}
+
+
+def test_streaming_matches_str():
+    for format, expected in expected_dumps.items():
+        fd = io.StringIO()
+        write_automaton(small, fd, format)
+        assert fd.getvalue() == expected
+        assert dump_automaton_to_str(small, format) == expected
+
+
+def test_streaming_round_trip(tmp_path):
+    path = tmp_path / "grammar.grape"
+    with open(path, "w") as fd:
+        write_automaton(grammar, fd, AutomatonFormat.GRAPE)
+    with open(path) as fd:
+        loaded = read_automaton(fd, AutomatonFormat.GRAPE)
+    assert loaded.rules == grammar.map_alphabet(str).rules
+    assert loaded.finals == grammar.finals
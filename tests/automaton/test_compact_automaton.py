@@ -0,0 +1,63 @@
+from grape.automaton.compact_automaton import CompactDFTA
+from grape.automaton_generator import grammar_by_saturation, size_constraint
+from grape.dsl import DSL
+
+
+dsl = DSL(
+    {
+        "1": ("int", 1),
+        "0": ("int", 0),
+        "+": ("int -> int -> int", lambda x, y: x + y),
+        "-": ("int -> int", lambda x: -x),
+    }
+)
+
+grammar = grammar_by_saturation(dsl, "int->int", [size_constraint(0, 5)])
+
+
+def test_round_trip():
+    compact = CompactDFTA.from_dfta(grammar)
+    assert compact.size() == grammar.size()
+    back = compact.to_dfta()
+    assert back.rules == grammar.rules
+    assert back.finals == grammar.finals
+
+
+def test_read():
+    compact = CompactDFTA.from_dfta(grammar)
+    for (letter, args), dst in grammar.rules.items():
+        ids = tuple(map(compact.state_id, args))
+        out = compact.read(compact.letter_id(letter), ids)
+        assert out is not None and compact.state_names[out] == dst
+
+
+def test_count():
+    compact = CompactDFTA.from_dfta(grammar)
+    assert compact.trees_by_size(10) == grammar.trees_by_size(10)
+    assert compact.trees_by_size(10, False) == grammar.trees_by_size(10, False)
+
+
+def test_reduce_and_minimise():
+    dfta = grammar.copy()
+    dfta.finals = {q for q in dfta.finals if q[1][0] == 3}
+    compact = CompactDFTA.from_dfta(dfta)
+    dfta.reduce()
+    compact.reduce()
+    assert compact.to_dfta().rules == dfta.rules
+    minimised = compact.minimise()
+    assert minimised.size() == dfta.minimise().size()
+    assert minimised.trees_by_size(10) == dfta.trees_by_size(10)
+
+
+def test_product():
+    other = grammar_by_saturation(dsl, "int->int", [size_constraint(0, 3)])
+    other.finals = {q for q in other.finals if q[1][0] % 2 == 1}
+    compact = CompactDFTA.from_dfta(grammar)
+    compact_other = CompactDFTA.from_dfta(other)
+    for union in [False, True]:
+        expected, built = grammar.product(other, union)
+        out, compact_built = compact.product(compact_other, union)
+        assert compact_built == built
+        back = out.to_dfta()
+        assert back.rules == expected.rules
+        assert back.finals == expected.finals
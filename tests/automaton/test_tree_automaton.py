@@ -0,0 +1,177 @@
+import random
+
+from grape.automaton_generator import (
+    depth_constraint,
+    grammar_by_saturation,
+    size_constraint,
+)
+from grape.dsl import DSL
+from grape.enumerator import Enumerator
+from grape.program import Primitive, str_to_program
+
+
+dsl = DSL(
+    {
+        "1": ("int", 1),
+        "0": ("int", 0),
+        "+": ("int -> int -> int", lambda x, y: x + y),
+        "-": ("int -> int", lambda x: -x),
+        "True": ("bool", True),
+        "ite": ("bool -> int -> int -> int", lambda b, x, y: x if b else y),
+    }
+)
+
+
+def __classes__(state2cls: dict) -> set:
+    """
+    Equivalence classes as a set of frozensets of states, ignoring class identifiers.
+    """
+    classes: dict = {}
+    for state, cls in state2cls.items():
+        classes.setdefault(cls, set()).add(state)
+    return {frozenset(states) for states in classes.values()}
+
+
+def test_minimise_cross_check():
+    for constraints in [
+        [],
+        [size_constraint(0, 6)],
+        [depth_constraint(0, 3)],
+        [size_constraint(3, -1)],
+    ]:
+        grammar = grammar_by_saturation(dsl, "int->int", constraints)
+        grammar.reduce()
+        minimised = grammar.minimise(cross_check=True)
+        assert minimised.trees_by_size(9) == grammar.trees_by_size(9)
+
+
+def test_minimise_can_be_merged():
+    grammar = grammar_by_saturation(dsl, "int->int", [size_constraint(0, 6)])
+    grammar.reduce()
+    minimised = grammar.minimise(
+        can_be_merged=lambda x, y: x[0] == y[0], cross_check=True
+    )
+    for cls in minimised.all_states:
+        assert len({q[0] for q in cls}) == 1
+    assert minimised.trees_by_size(9) == grammar.trees_by_size(9)
+
+
+def test_reduce():
+    grammar = grammar_by_saturation(dsl, "int->int", [size_constraint(0, 6)])
+    grammar.finals = {q for q in grammar.finals if q[1][0] == 4}
+    assert grammar.has_unproductive_rules()
+    before = grammar.trees_by_size(9)
+    grammar.reduce()
+    assert not grammar.has_unproductive_rules()
+    assert grammar.trees_by_size(9) == before
+    assert all(q[1][0] <= 4 for q in grammar.states)
+
+
+def test_cache_invalidation():
+    grammar = grammar_by_saturation(dsl, "int->int", [size_constraint(0, 4)])
+    states = grammar.states
+    assert grammar.states is states
+    new_state = ("int", (10,))
+    grammar.rules[(Primitive("2"), ())] = new_state
+    assert new_state in grammar.states
+    assert Primitive("2") in grammar.alphabet
+    assert (Primitive("2"), ()) in grammar.reversed_rules[new_state]
+    del grammar.rules[(Primitive("2"), ())]
+    assert new_state not in grammar.all_states
+    grammar.finals.add(new_state)
+    grammar.reduce()
+    assert new_state not in grammar.finals
+
+
+def test_scc_analyses():
+    bounded = grammar_by_saturation(dsl, "int->int", [size_constraint(0, 5)])
+    bounded.reduce()
+    scc = bounded.scc()
+    assert not bounded.is_unbounded()
+    assert not any(scc.cyclic)
+    for i, component in enumerate(scc.components):
+        for q in component:
+            for _, args in bounded.reversed_rules[q]:
+                assert all(scc.component_of[arg] <= i for arg in args)
+    size, depth = bounded.compute_max_size_and_depth()
+    assert size == max(s for s, n in bounded.trees_by_size(7).items() if n > 0)
+    assert depth == 5
+    assert not bounded.__has_cloning_derivation__()
+
+    unbounded = grammar_by_saturation(dsl, "int->int", [])
+    unbounded.reduce()
+    assert unbounded.is_unbounded()
+    assert unbounded.__has_cloning_derivation__()
+    try:
+        unbounded.compute_max_size_and_depth()
+        assert False
+    except ValueError:
+        pass
+
+
+def test_run():
+    unbounded = grammar_by_saturation(dsl, "int->int", [])
+    gen = Enumerator(unbounded).enumerate_until_size(7)
+    programs = [next(gen)]
+    try:
+        while True:
+            programs.append(gen.send(True))
+    except StopIteration:
+        pass
+    bounded = grammar_by_saturation(dsl, "int->int", [size_constraint(0, 4)])
+    expected = [p.size() <= 4 for p in programs]
+    assert any(expected) and not all(expected)
+    assert bounded.accepts_many(programs) == expected
+    # Letters are matched by name
+    assert bounded.map_alphabet(str).accepts_many(programs) == expected
+    states = bounded.run_many(programs)
+    assert all(
+        state == bounded.run(p) for state, p in zip(states, programs) if p.size() <= 4
+    )
+    assert bounded.run(str_to_program("(+ var0 unknown)")) is None
+
+
+def test_inclusion():
+    small = grammar_by_saturation(dsl, "int->int", [size_constraint(0, 5)])
+    big = grammar_by_saturation(dsl, "int->int", [size_constraint(0, 6)])
+    shallow = grammar_by_saturation(dsl, "int->int", [depth_constraint(0, 3)])
+    assert small.is_subset_of(big) == (True, None)
+    included, counterexample = big.is_subset_of(small)
+    assert not included
+    assert counterexample is not None and counterexample.size() == 6
+    assert big.run(counterexample) in big.finals
+    assert small.run(counterexample) not in small.finals
+    included, counterexample = small.is_subset_of(shallow)
+    assert not included and counterexample is not None
+    assert shallow.run(counterexample) not in shallow.finals
+    small.reduce()
+    assert small.is_equivalent(small.minimise()) == (True, None)
+    assert small.map_alphabet(str).is_equivalent(small) == (True, None)
+
+
+def test_update_equivalence_classes():
+    rng = random.Random(1)
+    for constraints in [[size_constraint(0, 6)], [depth_constraint(0, 3)], []]:
+        for _ in range(20):
+            grammar = grammar_by_saturation(dsl, "int->int", constraints)
+            grammar.reduce()
+            previous = grammar.equivalence_classes()
+            old_rules = dict(grammar.rules)
+            old_finals = set(grammar.finals)
+            states = sorted(grammar.states, key=str)
+            for key in rng.sample(sorted(grammar.rules, key=str), 2):
+                if rng.random() < 0.5:
+                    del grammar.rules[key]
+                else:
+                    grammar.rules[key] = rng.choice(states)
+            grammar.finals.symmetric_difference_update({rng.choice(states)})
+            grammar.reduce()
+            changed = [
+                key
+                for key in set(old_rules) | set(grammar.rules)
+                if old_rules.get(key) != grammar.rules.get(key)
+            ]
+            updated = grammar.update_equivalence_classes(
+                previous, changed, old_finals ^ grammar.finals
+            )
+            assert __classes__(updated) == __classes__(grammar.equivalence_classes())
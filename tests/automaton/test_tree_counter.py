@@ -0,0 +1,93 @@
+import math
+
+import pytest
+from grape.automaton.tree_counter import HAS_NUMPY, LogTreeCounter
+from grape.automaton_generator import (
+    depth_constraint,
+    grammar_by_saturation,
+    size_constraint,
+)
+from grape.dsl import DSL
+from grape.enumerator import Enumerator
+from grape.partitions import integer_partitions
+
+
+dsl = DSL(
+    {
+        "1": ("int", 1),
+        "0": ("int", 0),
+        "+": ("int -> int -> int", lambda x, y: x + y),
+        "-": ("int -> int", lambda x: -x),
+        "True": ("bool", True),
+        "ite": ("bool -> int -> int -> int", lambda b, x, y: x if b else y),
+    }
+)
+
+
+def naive_counts(grammar, size: int) -> dict:
+    count = {state: {} for state in grammar.states}
+    for csize in range(1, size + 1):
+        for state in grammar.states:
+            count[state][csize] = 0
+            for _, args in grammar.reversed_rules[state]:
+                if len(args) == 0 and csize == 1:
+                    count[state][csize] += 1
+                elif len(args) > 0:
+                    for partition in integer_partitions(len(args), csize - 1):
+                        total = 1
+                        for arg_size, arg in zip(partition, args):
+                            total *= count[arg][arg_size]
+                        count[state][csize] += total
+    return count
+
+
+def test_same_as_naive():
+    for constraints in [[], [size_constraint(0, 7)], [depth_constraint(0, 3)]]:
+        grammar = grammar_by_saturation(dsl, "int->int", constraints)
+        assert grammar.trees_by_state(12) == naive_counts(grammar, 12)
+
+
+def test_same_as_enumeration():
+    grammar = grammar_by_saturation(dsl, "int->int")
+    e = Enumerator(grammar)
+    gen = e.enumerate_until_size(7)
+    next(gen)
+    try:
+        while True:
+            gen.send(True)
+    except StopIteration:
+        pass
+    expected = {size: e.count_programs_at_size(size) for size in range(1, 7)}
+    assert grammar.trees_by_size(6, finals_only=False) == expected
+
+
+def test_incremental():
+    grammar = grammar_by_saturation(dsl, "int->int")
+    small = grammar.trees_by_size(5)
+    large = grammar.trees_by_size(40)
+    assert all(large[s] == small[s] for s in small)
+    assert large[40] > 0
+
+
+@pytest.mark.parametrize("use_numpy", [False, True])
+def test_log_counts(use_numpy: bool):
+    if use_numpy and not HAS_NUMPY:
+        pytest.skip("NumPy is not installed")
+    grammar = grammar_by_saturation(dsl, "int->int", [size_constraint(0, 9)])
+    counter = LogTreeCounter(
+        ((args, dst) for (_, args), dst in grammar.rules.items()), use_numpy
+    )
+    approx = dict(counter.stream(40, grammar.finals))
+    for size, count in grammar.trees_by_size(40).items():
+        if count == 0:
+            assert approx[size] == -math.inf
+        else:
+            assert math.isclose(approx[size], math.log10(count), rel_tol=1e-9)
+
+
+def test_log_counts_large_size():
+    grammar = grammar_by_saturation(dsl, "int->int")
+    approx = grammar.log10_trees_by_size(200)
+    assert math.isclose(
+        approx[200], math.log10(grammar.trees_at_size(200)), rel_tol=1e-9
+    )
@@ -0,0 +1,8 @@
+from grape.cli.count import format_log10
+
+
+def test_format_log10():
+    assert format_log10(0) == "1.00e+00"
+    assert format_log10(2.5) == "3.16e+02"
+    assert format_log10(2.9999) == "1.00e+03"
+    assert format_log10(float("-inf")) == "0"
@@ -0,0 +1,55 @@
+import os
+import subprocess
+import sys
+
+import grape
+from grape.automaton.automaton_manager import dump_automaton_to_file
+from grape.automaton_generator import grammar_by_saturation
+from grape.dsl import DSL
+
+
+dsl = DSL(
+    {
+        "1": ("int", 1),
+        "+": ("int -> int -> int", lambda x, y: x + y),
+        "-": ("int -> int", lambda x: -x),
+    }
+)
+
+max_size = 7
+
+
+def __enum__(path: str, *options: str) -> list[str]:
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.path.dirname(os.path.dirname(grape.__file__))
+    out = subprocess.run(
+        [sys.executable, "-m", "grape.cli.enum", path, "--size", str(max_size)]
+        + list(options),
+        capture_output=True,
+        check=True,
+        env=env,
+        text=True,
+    )
+    return out.stdout.splitlines()
+
+
+def test_enum(tmp_path):
+    path = str(tmp_path / "grammar.grape")
+    dump_automaton_to_file(
+        grammar_by_saturation(dsl, "int->int").classic_state_renaming(), path
+    )
+    plain = __enum__(path)
+    assert len(plain) == len(set(plain))
+    # Sharded and parallel outputs follow the order of the sampler
+    sharded = __enum__(path, "--shard", "0/1")
+    assert sorted(sharded) == sorted(plain)
+    merged = [line for i in range(3) for line in __enum__(path, "--shard", f"{i}/3")]
+    assert sorted(merged) == sorted(plain)
+    assert __enum__(path, "--workers", "2") == sharded
+    assert __enum__(path, "--workers", "2", "--shard", "1/3") == __enum__(
+        path, "--shard", "1/3"
+    )
+    assert __enum__(path, "--count-only") == [str(len(plain))]
+    assert __enum__(path, "--count-only", "--shard", "1/3") == [
+        str(len(__enum__(path, "--shard", "1/3")))
+    ]
@@ -3,6 +3,7 @@ from grape.automaton_generator import (
     grammar_by_saturation,
     size_constraint,
 )
+from grape.automaton.tree_automaton import DFTA
 from grape.dsl import DSL
 
 
@@ -25,3 +26,27 @@ def test():
     )
     a = inter.trees_by_size(100)
     assert a == other.trees_by_size(100)
+
+
+def test_only_reachable_product_states():
+    size = grammar_by_saturation(dsl, "int->int", [size_constraint(0, 5)])
+    depth = grammar_by_saturation(dsl, "int->int", [depth_constraint(0, 2)])
+    inter, built = size.product(depth)
+    # pairs of states that can be read on a common tree
+    assert built < len(size.states) * len(depth.states)
+    assert built >= len(inter.states)
+    assert inter.rules == size.read_intersection(depth).rules
+
+
+def test_many():
+    size = grammar_by_saturation(dsl, "int->int", [size_constraint(0, 7)])
+    depth = grammar_by_saturation(dsl, "int->int", [depth_constraint(0, 3)])
+    odd = grammar_by_saturation(dsl, "int->int", [size_constraint(3, -1)])
+    inter, built = DFTA.product_many([size, depth, odd])
+    assert all(len(q) == 3 for q in inter.states)
+    pairwise = size.read_intersection(depth).read_intersection(odd)
+    assert built >= len(inter.states)
+    assert inter.trees_by_size(20) == pairwise.trees_by_size(20)
+    assert (
+        DFTA.read_intersection_many([size, depth]).rules == size.product(depth)[0].rules
+    )
@@ -216,3 +216,38 @@ def test_is_superset():
         assert set(old_memory_to_size.get(size, [])).issubset(
             set(new_memory_to_size[size])
         )
+
+
+class InterruptedEvaluator(Evaluator):
+    def eval(self, program, type_req):
+        if program.size() == max_size:
+            raise KeyboardInterrupt
+        return super().eval(program, type_req)
+
+
+@pytest.mark.parametrize("compact", [False, True])
+def test_resume(tmp_path, compact: bool):
+    manager = EquivalenceClassManager()
+    evaluator = Evaluator(dsl, inputs, {}, set())
+    direct = prune(dsl, evaluator, manager, max_size=max_size, compact_memory=compact)
+    checkpoint_dir = str(tmp_path)
+    with pytest.raises(KeyboardInterrupt):
+        prune(
+            dsl,
+            InterruptedEvaluator(dsl, inputs, {}, set()),
+            EquivalenceClassManager(),
+            max_size=max_size,
+            compact_memory=compact,
+            checkpoint_dir=checkpoint_dir,
+        )
+    resumed = prune(
+        dsl,
+        Evaluator(dsl, inputs, {}, set()),
+        EquivalenceClassManager(),
+        max_size=max_size,
+        compact_memory=compact,
+        checkpoint_dir=checkpoint_dir,
+        resume=True,
+    )
+    assert direct.rules == resumed.rules
+    assert direct.finals == resumed.finals
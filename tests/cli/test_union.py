@@ -3,6 +3,7 @@ from grape.automaton_generator import (
     grammar_by_saturation,
     size_constraint,
 )
+from grape.automaton.tree_automaton import DFTA
 from grape.dsl import DSL
 
 
@@ -25,3 +26,14 @@ def test():
     )
     a = inter.trees_by_size(100)
     assert a == other.trees_by_size(100)
+
+
+def test_many():
+    grammars = [
+        grammar_by_saturation(dsl, "int->int", [size_constraint(0, 5)]),
+        grammar_by_saturation(dsl, "int->int", [depth_constraint(0, 3)]),
+        grammar_by_saturation(dsl, "int->int", [size_constraint(0, 7)]),
+    ]
+    union = DFTA.read_union_many(grammars)
+    pairwise = grammars[0].read_union(grammars[1]).read_union(grammars[2])
+    assert union.trees_by_size(20) == pairwise.trees_by_size(20)
@@ -1,6 +1,8 @@
+import pytest
 from grape.automaton_generator import grammar_by_saturation
 from grape.dsl import DSL
-from grape.enumerator import Enumerator
+from grape.enumerator import CombinationCache, Enumerator, WeightedEnumerator
+from grape.program import Function, Primitive
 
 
 dsl = DSL(
@@ -66,3 +68,153 @@ def test_enumerator_deterministic_order():
             assert g1.send(True) == g2.send(True)
     except StopIteration:
         pass
+
+
+def __all_programs__(gen) -> list:
+    programs = [next(gen)]
+    try:
+        while True:
+            programs.append(gen.send(True))
+    except StopIteration:
+        pass
+    return programs
+
+
+def test_weighted_enumerator_by_size():
+    weighted = WeightedEnumerator(grammar, lambda letter, args: 1)
+    programs = __all_programs__(weighted.enumerate_until_cost(max_size))
+    sizes = [p.size() for p in programs]
+    assert sizes == sorted(sizes)
+    expected = __all_programs__(Enumerator(grammar).enumerate_until_size(max_size))
+    assert set(programs) == set(expected)
+    assert len(programs) == len(expected)
+
+
+def test_weighted_enumerator_by_cost():
+    def cost(letter, args) -> float:
+        return 2.5 if str(letter) == "+" else 0.5
+
+    def program_cost(program) -> float:
+        if isinstance(program, Function):
+            return cost(program.function, None) + sum(
+                program_cost(arg) for arg in program.arguments
+            )
+        return cost(program, None)
+
+    weighted = WeightedEnumerator(grammar, cost)
+    programs = __all_programs__(weighted.enumerate_until_cost(9))
+    costs = [program_cost(p) for p in programs]
+    assert costs == sorted(costs)
+    expected = {
+        p
+        for p in __all_programs__(Enumerator(grammar).enumerate_until_size(10))
+        if program_cost(p) < 9
+    }
+    assert set(programs) == expected
+
+
+def test_weighted_enumerator_unreduced():
+    unreduced = grammar.copy()
+    state = next(iter(grammar.finals))
+    unreduced.rules[(Primitive("+"), (state, "unreachable"))] = state
+    unreduced.rules[(Primitive("+"), ("unreachable", state))] = "unreachable"
+    weighted = WeightedEnumerator(unreduced, lambda letter, args: 1)
+    programs = __all_programs__(weighted.enumerate_until_cost(max_size))
+    expected = __all_programs__(Enumerator(grammar).enumerate_until_size(max_size))
+    assert set(programs) == set(expected)
+
+
+def test_weighted_enumerator_rejects_free_rules():
+    with pytest.raises(ValueError):
+        WeightedEnumerator(grammar, lambda letter, args: 0 if len(args) == 0 else 1)
+
+
+def test_compact_enumerator():
+    def keep_some(gen) -> list:
+        programs = [next(gen)]
+        try:
+            while True:
+                programs.append(gen.send(len(programs) % 3 != 0))
+        except StopIteration:
+            pass
+        return programs
+
+    e1 = Enumerator(grammar)
+    e2 = Enumerator(grammar, compact=True)
+    assert keep_some(e1.enumerate_until_size(max_size + 2)) == keep_some(
+        e2.enumerate_until_size(max_size + 2)
+    )
+    for state in e1.memory:
+        assert sorted(e2.memory[state].keys()) == list(range(1, max_size + 2))
+        for size in range(1, max_size + 2):
+            assert e1.memory[state][size] == e2.memory[state][size]
+    for size in range(1, max_size + 2):
+        assert e1.count_programs_at_size(size) == e2.count_programs_at_size(size)
+
+
+def test_spilled_enumerator(tmp_path):
+    e1 = Enumerator(grammar)
+    e2 = Enumerator(grammar, spill_dir=str(tmp_path))
+    assert __all_programs__(e1.enumerate_until_size(max_size + 2)) == __all_programs__(
+        e2.enumerate_until_size(max_size + 2)
+    )
+    (spill,) = tmp_path.iterdir()
+    # One file per non empty size
+    sizes = range(1, max_size + 2)
+    assert len(list(spill.iterdir())) == sum(
+        e1.count_programs_at_size(size) > 0 for size in sizes
+    )
+    for state in e1.memory:
+        for size in range(1, max_size + 2):
+            assert e1.memory[state][size] == e2.memory[state][size]
+    e2.close()
+    assert len(list(tmp_path.iterdir())) == 0
+
+
+def test_combination_cache():
+    expected = __all_programs__(Enumerator(grammar).enumerate_until_size(max_size + 2))
+    for policy, cache_bytes in [
+        (CombinationCache.NONE, 0),
+        (CombinationCache.LRU, 0),
+        (CombinationCache.LRU, 1000),
+        (CombinationCache.LRU, 2**20),
+    ]:
+        e = Enumerator(grammar, combination_cache=policy, cache_bytes=cache_bytes)
+        assert __all_programs__(e.enumerate_until_size(max_size + 2)) == expected
+        assert e.cache_used_bytes <= cache_bytes
+        assert sum(len(by_size) for by_size in e.memory_combinations.values()) == len(
+            e.lru
+        )
+        if policy == CombinationCache.NONE or cache_bytes == 0:
+            assert e.cache_hits == 0
+
+
+def test_checkpoint(tmp_path):
+    for options in [{}, {"compact": True}, {"spill_dir": str(tmp_path)}]:
+        e1 = Enumerator(grammar, **options)
+        programs = __all_programs__(e1.enumerate_until_size(max_size))
+        e1.save_checkpoint(str(tmp_path), {"first": programs[0], "all": programs})
+        e2 = Enumerator(grammar, **options)
+        extra = e2.load_checkpoint(str(tmp_path))
+        assert extra["all"] == programs
+        assert e2.current_size == e1.current_size
+        for state in e1.memory:
+            for size in range(1, max_size):
+                assert e1.memory[state][size] == e2.memory[state][size]
+        assert __all_programs__(
+            e1.enumerate_until_size(max_size + 2)
+        ) == __all_programs__(e2.enumerate_until_size(max_size + 2))
+
+
+def test_enumerator_depth():
+    def depth(program) -> int:
+        if isinstance(program, Function):
+            return 1 + max(depth(arg) for arg in program.arguments)
+        return 1
+
+    programs = __all_programs__(Enumerator(grammar).enumerate_until_depth(4))
+    depths = [depth(p) for p in programs]
+    assert depths == sorted(depths)
+    assert len(programs) == len(set(programs))
+    expected = __all_programs__(Enumerator(grammar).enumerate_until_size(8))
+    assert set(programs) == {p for p in expected if depth(p) < 4}
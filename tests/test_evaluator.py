@@ -127,3 +127,45 @@ def test_skip_exception():
         e.eval(r, tr)
     except ZeroDivisionError:
         assert False
+
+
+def test_columnar():
+    def vectorized_add(xs: list, ys: list) -> list:
+        return [x + y for x, y in zip(xs, ys)]
+
+    def vectorized_div(xs: list, ys: list) -> list:
+        return [x // y for x, y in zip(xs, ys)]
+
+    primitives = {
+        "1": ("int", 1),
+        "0": ("int", 0),
+        "+": ("int -> int -> int", lambda x, y: x + y),
+        "-": ("int -> int", lambda x: -x),
+        "/": ("int -> int -> int", lambda x, y: x // y),
+    }
+    vectorized_dsl = DSL(
+        {
+            **primitives,
+            "+": (*primitives["+"], vectorized_add),
+            "/": (*primitives["/"], vectorized_div),
+        }
+    )
+    tr = "int->int->int"
+    grammar = grammar_by_saturation(DSL(primitives), tr)
+    evaluators = [
+        Evaluator(DSL(primitives), inputs, {}, {ZeroDivisionError}),
+        Evaluator(DSL(primitives), inputs, {}, {ZeroDivisionError}, columnar=True),
+        Evaluator(vectorized_dsl, inputs, {}, {ZeroDivisionError}, columnar=True),
+    ]
+    e = Enumerator(grammar)
+    g = e.enumerate_until_size(max_size + 1)
+    p = next(g)
+    try:
+        while True:
+            outs = [evaluator.eval(p, tr) for evaluator in evaluators]
+            assert outs[1:] == outs[:-1]
+            p = g.send(outs[0] is None)
+    except StopIteration:
+        pass
+    for evaluator in evaluators[1:]:
+        assert evaluator.equiv_classes == evaluators[0].equiv_classes
@@ -0,0 +1,56 @@
+import io
+
+import pytest
+
+from grape.automaton_generator import grammar_by_saturation
+from grape.dsl import DSL
+from grape.enumerator import Enumerator
+from grape.program_stream import ProgramEncoder, read_programs
+
+
+dsl = DSL(
+    {
+        "1": ("int", 1),
+        "+": ("int -> int -> int", lambda x, y: x + y),
+        "-": ("int -> int", lambda x: -x),
+    }
+)
+
+grammar = grammar_by_saturation(dsl, "int->int")
+
+
+def __all_programs__(size: int) -> list:
+    gen = Enumerator(grammar).enumerate_until_size(size)
+    programs = [next(gen)]
+    try:
+        while True:
+            programs.append(gen.send(True))
+    except StopIteration:
+        pass
+    return programs
+
+
+def test_round_trip():
+    programs = __all_programs__(7)
+    encoder = ProgramEncoder.from_dfta(grammar)
+    fd = io.BytesIO(
+        encoder.header()
+        + encoder.encode_many(programs[:10])
+        + encoder.encode_many(programs[10:])
+    )
+    assert list(read_programs(fd)) == programs
+
+
+def test_streaming():
+    programs = __all_programs__(7)
+    encoder = ProgramEncoder.from_dfta(grammar)
+    data = encoder.header() + encoder.encode_many(programs)
+
+    class SmallReads(io.BytesIO):
+        def read(self, n: int = -1) -> bytes:
+            return super().read(min(n, 7) if n >= 0 else 7)
+
+    # Reads are shorter than headers and programs
+    assert list(read_programs(SmallReads(data))) == programs
+    with pytest.raises(ValueError):
+        list(read_programs(io.BytesIO(data[:-2])))
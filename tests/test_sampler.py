@@ -0,0 +1,72 @@
+from grape.automaton_generator import grammar_by_saturation
+from grape.dsl import DSL
+from grape.enumerator import Enumerator
+from grape.sampler import Sampler
+
+
+dsl = DSL(
+    {
+        "1": ("int", 1),
+        "+": ("int -> int -> int", lambda x, y: x + y),
+        "-": ("int -> int", lambda x: -x),
+    }
+)
+
+grammar = grammar_by_saturation(dsl, "int->int")
+max_size = 6
+
+
+def test_unrank_is_a_bijection():
+    enumerated = []
+    gen = Enumerator(grammar).enumerate_until_size(max_size + 1)
+    enumerated.append(next(gen))
+    try:
+        while True:
+            enumerated.append(gen.send(True))
+    except StopIteration:
+        pass
+    sampler = Sampler(grammar)
+    for size in range(1, max_size + 1):
+        expected = {p for p in enumerated if p.size() == size}
+        unranked = [sampler.unrank(size, k) for k in range(sampler.count(size))]
+        assert len(unranked) == len(expected)
+        assert set(unranked) == expected
+
+
+def test_sample():
+    sampler = Sampler(grammar, seed=0)
+    programs = sampler.sample(30, 200)
+    assert len(programs) == 200
+    assert all(p.size() == 30 for p in programs)
+    assert all(state in grammar.finals for state in grammar.run_many(programs))
+    assert Sampler(grammar, seed=0).sample(30, 200) == programs
+
+
+def test_rank_unrank():
+    for size in range(1, max_size + 1):
+        for k in range(grammar.trees_at_size(size)):
+            program = grammar.unrank(size, k)
+            assert program.size() == size
+            assert grammar.rank(program) == k
+    large = grammar.trees_at_size(40)
+    for k in [0, 1, large // 3, large - 1]:
+        assert grammar.rank(grammar.unrank(40, k)) == k
+
+
+def test_rank_before_unrank():
+    program = grammar.unrank(7, 3)
+    fresh = grammar_by_saturation(dsl, "int->int")
+    assert fresh.rank(program) == 3
+
+
+def test_programs_by_range():
+    sampler = Sampler(grammar)
+    for size in range(1, max_size + 1):
+        count = sampler.count(size)
+        assert list(sampler.programs(size)) == [
+            sampler.unrank(size, k) for k in range(count)
+        ]
+        middle = count // 3
+        assert list(sampler.programs(size, middle, 2 * middle + 1)) == [
+            sampler.unrank(size, k) for k in range(middle, 2 * middle + 1)
+        ]